@@ -0,0 +1,13 @@
+"""
+Response classes shared between routes
+"""
+from starlette.responses import FileResponse
+
+
+class LargeFileResponse(FileResponse):
+    """
+    FileResponse for multi-MB media. Reads 1 MiB per chunk instead of
+    Starlette's 64 KiB default; Range requests are handled by Starlette
+    (>= 0.39) so players can seek without re-downloading.
+    """
+    chunk_size = 1 << 20
@@ -0,0 +1,67 @@
+"""
+Request/response models shared between routes
+"""
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, List, Literal, Optional, Union
+
+
+class UploadRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    url: str
+    name: Optional[str] = None
+
+
+class UploadResponse(BaseModel):
+    id: str
+    name: str
+    length: float
+    stream_url: Optional[str] = None
+
+
+class TrimRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    type: Literal["trim"] = "trim"
+    video_id: str
+    start: float
+    end: float
+
+
+class TextOverlayRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    type: Literal["text_overlay"] = "text_overlay"
+    video_id: str
+    text: str
+    start: float = 0
+    duration: float = 5
+    position: str = "center"
+
+
+class TextOverlay(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    text: str
+    start: float = 0
+    duration: float = 5
+
+
+class TextOverlaysRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    video_id: str
+    overlays: List[TextOverlay]
+    video_start: Optional[float] = None
+    video_end: Optional[float] = None
+
+
+class BatchEditRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    ops: List[Annotated[Union[TrimRequest, TextOverlayRequest], Field(discriminator="type")]]
+
+
+class EditResponse(BaseModel):
+    stream_url: str
+    status: str = "success"
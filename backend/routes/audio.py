@@ -2,31 +2,142 @@
 Audio routes for uploading and merging audio with video
 """
 import os
+import stat
+import time
+import getpass
+import shutil
+import asyncio
 import tempfile
 import uuid
+import orjson
 from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from services.videodb_client import get_videodb_client
-from services.ffmpeg_service import merge_audio_with_video_stream
+from services.ffmpeg_service import (
+    merge_audio_with_video_stream,
+    merge_audio_stream_with_video_stream,
+)
+from routes._schemas import UploadRequest, UploadResponse
+from routes._responses import LargeFileResponse
 
 router = APIRouter()
 
-# Store merged files temporarily (in production, use proper storage)
-MERGED_FILES = {}
+# Uploads are copied to disk in chunks so a large file is never held in memory
+UPLOAD_CHUNK_SIZE = 1 << 20
 
+# MP4-family audio keeps its index at the end of the file, so FFmpeg
+# needs a seekable input for these and they can't be piped
+SEEKABLE_AUDIO_SUFFIXES = {".m4a", ".mp4", ".mov", ".3gp"}
 
-class AudioUploadRequest(BaseModel):
-    url: str
-    name: Optional[str] = None
 
 
-class AudioUploadResponse(BaseModel):
-    id: str
-    name: str
-    length: float
+def _merged_dir() -> str:
+    """
+    Directory for merged outputs. The default lives in the shared temp dir,
+    so it's created per user with mode 0o700 and must be ours; otherwise
+    another local user could plant files there.
+    """
+    configured = os.getenv("MERGED_DIR")
+    if configured:
+        os.makedirs(configured, exist_ok=True)
+        return configured
+    
+    path = os.path.join(tempfile.gettempdir(), f"merged_{getpass.getuser()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    owned = not hasattr(os, "getuid") or (st.st_uid == os.getuid() and not st.st_mode & 0o077)
+    if stat.S_ISDIR(st.st_mode) and owned:
+        return path
+    print(f"⚠️ {path} is not a private directory, using a fresh one for this process")
+    return tempfile.mkdtemp(prefix="merged_")
+
+
+# Merged outputs live on disk named by file_id, so any uvicorn worker can
+# serve a file merged by another one
+MERGED_DIR = _merged_dir()
+
+# How long a merged file stays downloadable, and how many we keep at once
+MERGED_FILE_TTL = 3600
+MERGED_FILE_MAX = 1024
+MERGED_EXPIRE_INTERVAL = 60
+# A sidecar is written just before its video is moved in; one still without
+# a video after this long was left by an interrupted store
+MERGED_ORPHAN_GRACE = 300
+
+_expire_task: Optional[asyncio.Task] = None
+
+
+def _merged_paths(file_id: str) -> tuple:
+    """Return the (video, metadata) paths for a merged file"""
+    base = os.path.join(MERGED_DIR, file_id)
+    return f"{base}.mp4", f"{base}.json"
+
+
+def _store_merged_file(merged_path: str, name: str) -> str:
+    """Move a merged output into MERGED_DIR and return its file_id"""
+    file_id = str(uuid.uuid4())
+    video_path, meta_path = _merged_paths(file_id)
+    # Write the friendly download name first so the video never appears without it
+    with open(meta_path, "wb") as f:
+        f.write(orjson.dumps({"name": name}))
+    shutil.move(merged_path, video_path)
+    return file_id
+
+
+def _expire_merged_files_sync():
+    """
+    Delete merged files past their TTL, then the oldest beyond MERGED_FILE_MAX,
+    then metadata sidecars whose video never arrived
+    """
+    now = time.time()
+    cutoff = now - MERGED_FILE_TTL
+    entries = sorted(
+        (entry for entry in os.scandir(MERGED_DIR) if entry.name.endswith(".mp4")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    for i, entry in enumerate(entries):
+        if i >= MERGED_FILE_MAX or entry.stat().st_mtime < cutoff:
+            for path in _merged_paths(entry.name[:-len(".mp4")]):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+    
+    for entry in os.scandir(MERGED_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        video_path, meta_path = _merged_paths(entry.name[:-len(".json")])
+        try:
+            if not os.path.exists(video_path) and entry.stat().st_mtime < now - MERGED_ORPHAN_GRACE:
+                os.unlink(meta_path)
+        except OSError:
+            pass
+
+
+async def _expire_merged_files():
+    while True:
+        await asyncio.sleep(MERGED_EXPIRE_INTERVAL)
+        try:
+            await asyncio.to_thread(_expire_merged_files_sync)
+        except OSError as e:
+            print(f"Merged file cleanup error: {e}")
+
+
+# Registered as app startup/shutdown hooks in server.py
+def start_merged_file_expiry():
+    global _expire_task
+    if _expire_task is None or _expire_task.done():
+        _expire_task = asyncio.create_task(_expire_merged_files())
+
+
+def stop_merged_file_expiry():
+    global _expire_task
+    if _expire_task is not None:
+        _expire_task.cancel()
+        _expire_task = None
 
 
 class AddAudioRequest(BaseModel):
@@ -49,17 +160,39 @@ class FFmpegMergeResponse(BaseModel):
     file_id: str
 
 
-@router.post("/audio/upload", response_model=AudioUploadResponse)
-async def upload_audio(request: AudioUploadRequest):
+@router.post("/audio/upload", response_model=UploadResponse)
+async def upload_audio(request: UploadRequest):
     """Upload audio from URL"""
     try:
         client = get_videodb_client()
-        result = client.upload_audio(request.url, request.name)
-        return AudioUploadResponse(**result)
+        result = await asyncio.to_thread(client.upload_audio, request.url, request.name)
+        return UploadResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    """Yield an uploaded file in UPLOAD_CHUNK_SIZE pieces"""
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def _merge_via_temp_file(video_stream_url: str, file: UploadFile, suffix: str) -> str:
+    """Fallback for containers FFmpeg can't read from a pipe (needs seekable input)"""
+    audio_temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        async for chunk in _iter_upload(file):
+            audio_temp.write(chunk)
+        audio_temp.close()
+        
+        return await merge_audio_with_video_stream(video_stream_url, audio_temp.name)
+    finally:
+        # Clean up audio temp
+        audio_temp.close()
+        if os.path.exists(audio_temp.name):
+            os.unlink(audio_temp.name)
+
+
 @router.post("/audio/merge-local")
 async def merge_audio_local(
     video_stream_url: str,
@@ -70,38 +203,29 @@ async def merge_audio_local(
     Returns URL to download merged video.
     """
     try:
-        # Save uploaded audio to temp file
         suffix = os.path.splitext(file.filename or ".mp3")[1]
-        audio_temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        content = await file.read()
-        audio_temp.write(content)
-        audio_temp.close()
-        
-        try:
-            # Merge using FFmpeg
-            merged_path = await merge_audio_with_video_stream(
+        if suffix.lower() in SEEKABLE_AUDIO_SUFFIXES:
+            merged_path = await _merge_via_temp_file(video_stream_url, file, suffix)
+        else:
+            # Pipe the upload straight into FFmpeg - no intermediate audio file
+            merged_path = await merge_audio_stream_with_video_stream(
                 video_stream_url,
-                audio_temp.name
+                _iter_upload(file)
             )
-            
-            # Generate file ID for retrieval
-            file_id = str(uuid.uuid4())
-            MERGED_FILES[file_id] = {
-                "path": merged_path,
-                "name": f"merged_{file.filename}"
-            }
-            
-            return {
-                "success": True,
-                "file_id": file_id,
-                "merged_url": f"/api/audio/merged/{file_id}",
-                "message": "Audio merged successfully with FFmpeg!"
-            }
-            
-        finally:
-            # Clean up audio temp
-            if os.path.exists(audio_temp.name):
-                os.unlink(audio_temp.name)
+        
+        # Generate file ID for retrieval
+        file_id = await asyncio.to_thread(
+            _store_merged_file,
+            merged_path,
+            f"merged_{file.filename}"
+        )
+        
+        return {
+            "success": True,
+            "file_id": file_id,
+            "merged_url": f"/api/audio/merged/{file_id}",
+            "message": "Audio merged successfully with FFmpeg!"
+        }
                 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"FFmpeg merge failed: {str(e)}")
@@ -110,17 +234,29 @@ async def merge_audio_local(
 @router.get("/audio/merged/{file_id}")
 async def get_merged_file(file_id: str):
     """Serve merged video file"""
-    if file_id not in MERGED_FILES:
+    try:
+        # Only well-formed IDs map to paths, so file_id can't escape MERGED_DIR
+        file_id = str(uuid.UUID(file_id))
+    except ValueError:
         raise HTTPException(status_code=404, detail="Merged file not found")
     
-    file_info = MERGED_FILES[file_id]
-    if not os.path.exists(file_info["path"]):
-        raise HTTPException(status_code=404, detail="File no longer available")
+    video_path, meta_path = _merged_paths(file_id)
+    try:
+        stat_result = os.stat(video_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Merged file not found")
+    
+    try:
+        with open(meta_path, "rb") as f:
+            name = orjson.loads(f.read())["name"]
+    except (OSError, ValueError, KeyError):
+        name = f"{file_id}.mp4"
     
-    return FileResponse(
-        file_info["path"],
+    return LargeFileResponse(
+        video_path,
         media_type="video/mp4",
-        filename=file_info["name"]
+        filename=name,
+        stat_result=stat_result
     )
 
 
@@ -129,7 +265,7 @@ async def add_audio_to_video(request: AddAudioRequest):
     """Add background audio to a video using VideoDB"""
     try:
         client = get_videodb_client()
-        result = client.add_audio_to_video(request.video_id, request.audio_id)
+        result = await asyncio.to_thread(client.add_audio_to_video, request.video_id, request.audio_id)
         return AddAudioResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
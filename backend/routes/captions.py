@@ -1,14 +1,22 @@
 """
 Caption generation routes - uses VideoDB's indexing for transcription
 """
+import asyncio
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import List, Optional
+from cachetools import TTLCache
 
 from services.videodb_client import get_videodb_client
 
 router = APIRouter()
 
+# Transcription is deterministic per video and by far the slowest call we make,
+# so generated captions are kept for an hour keyed by video_id
+TRANSCRIPT_CACHE = TTLCache(maxsize=512, ttl=3600)
+
 
 class CaptionRequest(BaseModel):
     video_id: str
@@ -25,41 +33,60 @@ class CaptionResponse(BaseModel):
     captions: List[Caption]
 
 
+def _to_captions(transcript) -> List[dict]:
+    """
+    Convert a VideoDB transcript to caption dicts. Long videos have thousands
+    of segments, so this builds plain dicts rather than validated Caption models.
+    """
+    segments = getattr(transcript, 'segments', None)
+    if transcript and segments is not None:
+        return [
+            {"start": segment.start, "end": segment.end, "text": segment.text}
+            for segment in segments
+        ]
+    if transcript and isinstance(transcript, list):
+        return [
+            {
+                "start": segment.get('start', 0),
+                "end": segment.get('end', 0),
+                "text": segment.get('text', '')
+            }
+            for segment in transcript
+        ]
+    return []
+
+
+def _caption_response(video_id: str, captions: List[dict]) -> Response:
+    # Returning the response directly skips re-validating every segment
+    # against CaptionResponse; the model still documents the schema
+    body = orjson.dumps({"video_id": video_id, "captions": captions})
+    return Response(body, media_type="application/json")
+
+
 @router.post("/captions/generate", response_model=CaptionResponse)
 async def generate_captions(request: CaptionRequest):
     """Generate captions for a video using VideoDB's transcription"""
+    cached = TRANSCRIPT_CACHE.get(request.video_id)
+    if cached is not None:
+        return _caption_response(request.video_id, cached)
+    
     try:
         client = get_videodb_client()
-        video = client.get_video(request.video_id)
+        video = await asyncio.to_thread(client.get_video, request.video_id)
         
         # Index the video for spoken words (this triggers transcription)
         # VideoDB uses its own AI to transcribe
-        video.index_spoken_words()
+        await asyncio.to_thread(video.index_spoken_words)
         
         # Get the transcript
-        transcript = video.get_transcript()
+        transcript = await asyncio.to_thread(video.get_transcript)
         
         # Convert to our caption format
-        captions = []
-        if transcript and hasattr(transcript, 'segments'):
-            for segment in transcript.segments:
-                captions.append(Caption(
-                    start=segment.start,
-                    end=segment.end,
-                    text=segment.text
-                ))
-        elif transcript and isinstance(transcript, list):
-            for segment in transcript:
-                captions.append(Caption(
-                    start=segment.get('start', 0),
-                    end=segment.get('end', 0),
-                    text=segment.get('text', '')
-                ))
+        captions = _to_captions(transcript)
         
-        return CaptionResponse(
-            video_id=request.video_id,
-            captions=captions
-        )
+        if captions:
+            TRANSCRIPT_CACHE[request.video_id] = captions
+        return _caption_response(request.video_id, captions)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -68,33 +95,20 @@ async def generate_captions(request: CaptionRequest):
 @router.get("/captions/{video_id}", response_model=CaptionResponse)
 async def get_captions(video_id: str):
     """Get existing captions for a video"""
+    cached = TRANSCRIPT_CACHE.get(video_id)
+    if cached is not None:
+        return _caption_response(video_id, cached)
+    
     try:
         client = get_videodb_client()
-        video = client.get_video(video_id)
+        video = await asyncio.to_thread(client.get_video, video_id)
         
         # Try to get existing transcript
-        transcript = video.get_transcript()
+        transcript = await asyncio.to_thread(video.get_transcript)
         
-        captions = []
-        if transcript and hasattr(transcript, 'segments'):
-            for segment in transcript.segments:
-                captions.append(Caption(
-                    start=segment.start,
-                    end=segment.end,
-                    text=segment.text
-                ))
-        elif transcript and isinstance(transcript, list):
-            for segment in transcript:
-                captions.append(Caption(
-                    start=segment.get('start', 0),
-                    end=segment.get('end', 0),
-                    text=segment.get('text', '')
-                ))
+        captions = _to_captions(transcript)
         
-        return CaptionResponse(
-            video_id=video_id,
-            captions=captions
-        )
+        return _caption_response(video_id, captions)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
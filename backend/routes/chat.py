@@ -2,19 +2,34 @@
 Chat route with AI agent for video editing
 """
 import os
-import json
+import asyncio
+import hashlib
+from functools import lru_cache
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import httpx
+import orjson
+from cachetools import TTLCache
 
 from services.agent_tools import get_tool_definitions
 from services.videodb_client import get_videodb_client
+from services.http_client import get_http_client
 
 router = APIRouter()
 
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# In-flight OpenRouter completions keyed by a hash of the request
+_inflight: Dict[str, asyncio.Task] = {}
+
+# Read-only tools hit VideoDB for data that rarely changes within seconds, so
+# their results are reused briefly; any write tool clears the cache
+READ_TOOLS = {"list_videos", "render_video"}
+WRITE_TOOLS = {"upload_video", "trim_video", "add_text_overlay"}
+_tool_cache = TTLCache(maxsize=256, ttl=5)
+
 SYSTEM_PROMPT = """You are an AI video editing assistant. You help users edit videos using natural language commands.
 
 You have access to the following tools:
@@ -47,6 +62,10 @@ RULES:
 4. Be concise - user may be listening via voice.
 """
 
+# Neither changes at runtime, so build them once instead of per request
+_TOOLS = get_tool_definitions()
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
 
 class Message(BaseModel):
     role: str
@@ -56,6 +75,7 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[Message]
     video_context: Optional[dict] = None
+    stream: bool = False  # Stream the reply as server-sent events
 
 
 class ChatResponse(BaseModel):
@@ -64,54 +84,146 @@ class ChatResponse(BaseModel):
     tool_results: Optional[List[dict]] = None
 
 
-async def call_openrouter(messages: list, tools: list) -> dict:
-    """Call OpenRouter API with tools"""
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY not set in environment")
-    
-    headers = {
+@lru_cache(maxsize=1)
+def _openrouter_headers(api_key: str) -> dict:
+    return {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
         "HTTP-Referer": "http://localhost:3000",
         "X-Title": "AI Video Editor"
     }
+
+
+def _build_openrouter_request(messages: list, tools: list) -> tuple:
+    """Build the headers and payload for an OpenRouter completion"""
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        raise ValueError("OPENROUTER_API_KEY not set in environment")
+    
+    headers = _openrouter_headers(api_key)
     
     payload = {
         "model": "openai/gpt-4o-mini",  # Cost-effective model with good tool support
-        "messages": [{"role": "system", "content": SYSTEM_PROMPT}] + messages,
+        "messages": [_SYSTEM_MSG, *messages],
         "tools": tools,
         "tool_choice": "auto"
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            OPENROUTER_URL,
-            headers=headers,
-            json=payload,
-            timeout=30.0
-        )
+    return headers, payload
+
+
+async def _post_openrouter(headers: dict, payload: dict) -> dict:
+    response = await get_http_client().post(OPENROUTER_URL, headers=headers, content=orjson.dumps(payload))
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+async def call_openrouter(messages: list, tools: list) -> dict:
+    """Call OpenRouter API with tools"""
+    headers, payload = _build_openrouter_request(messages, tools)
+    
+    # Identical prompts already in flight (double-clicks, retries) share one request
+    key = hashlib.blake2b(
+        orjson.dumps([payload["model"], messages, tools]),
+        digest_size=16
+    ).hexdigest()
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_post_openrouter(headers, payload))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # Shield so one caller disconnecting doesn't cancel the request for the others
+    return await asyncio.shield(task)
+
+
+async def stream_openrouter(messages: list, tools: list) -> AsyncIterator[str]:
+    """Call OpenRouter API with streaming enabled and yield content deltas"""
+    headers, payload = _build_openrouter_request(messages, tools)
+    payload["stream"] = True
+    
+    async with get_http_client().stream("POST", OPENROUTER_URL, headers=headers, content=orjson.dumps(payload)) as response:
         response.raise_for_status()
-        return response.json()
+        async for line in response.aiter_lines():
+            # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank lines
+            if not line.startswith("data: "):
+                continue
+            data = line[len("data: "):]
+            if data == "[DONE]":
+                break
+            
+            choices = orjson.loads(data).get("choices") or []
+            content = choices[0].get("delta", {}).get("content") if choices else None
+            if content:
+                yield content
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def _stream_chat_response(
+    messages: list,
+    tools: list,
+    tool_calls: Optional[List[dict]] = None,
+    tool_results: Optional[List[dict]] = None
+) -> AsyncIterator[str]:
+    """Stream the final completion as `token` events, ending with a `result` event"""
+    try:
+        parts = []
+        async for content in stream_openrouter(messages, tools):
+            parts.append(content)
+            yield _sse("token", {"content": content})
+        
+        result = ChatResponse(
+            response="".join(parts),
+            tool_calls=tool_calls,
+            tool_results=tool_results
+        )
+        yield _sse("result", result.model_dump())
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
 
 
 async def execute_tool(tool_name: str, arguments: dict) -> dict:
     """Execute a tool and return the result"""
+    if tool_name in READ_TOOLS:
+        key = (tool_name, orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS))
+        cached = _tool_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        result = await _run_tool(tool_name, arguments)
+        if "error" not in result:
+            _tool_cache[key] = result
+        return result
+    
+    result = await _run_tool(tool_name, arguments)
+    if tool_name in WRITE_TOOLS:
+        # Anything read before this edit may now be stale
+        _tool_cache.clear()
+    return result
+
+
+async def _run_tool(tool_name: str, arguments: dict) -> dict:
     try:
         client = get_videodb_client()
         
         if tool_name == "upload_video":
-            return client.upload_video(arguments["url"], arguments.get("name"))
+            return await asyncio.to_thread(client.upload_video, arguments["url"], arguments.get("name"))
         
         elif tool_name == "trim_video":
-            return client.trim_video(
+            return await asyncio.to_thread(
+                client.trim_video,
                 arguments["video_id"],
                 arguments["start"],
                 arguments["end"]
             )
         
         elif tool_name == "add_text_overlay":
-            return client.add_text_overlay(
+            return await asyncio.to_thread(
+                client.add_text_overlay,
                 arguments["video_id"],
                 arguments["text"],
                 arguments.get("start", 0),
@@ -122,10 +234,10 @@ async def execute_tool(tool_name: str, arguments: dict) -> dict:
             )
         
         elif tool_name == "list_videos":
-            return {"videos": client.list_videos()}
+            return {"videos": await asyncio.to_thread(client.list_videos)}
         
         elif tool_name == "render_video":
-            video = client.get_video(arguments["video_id"])
+            video = await asyncio.to_thread(client.get_video, arguments["video_id"])
             return {
                 "stream_url": video.stream_url,
                 "status": "rendered"
@@ -141,7 +253,7 @@ async def execute_tool(tool_name: str, arguments: dict) -> dict:
 async def chat(request: ChatRequest):
     """Chat with the AI video editing agent"""
     try:
-        tools = get_tool_definitions()
+        tools = _TOOLS
         messages = [{"role": m.role, "content": m.content} for m in request.messages]
         
         # Add video context if available
@@ -166,15 +278,21 @@ async def chat(request: ChatRequest):
         
         # Check for tool calls
         if "tool_calls" in message and message["tool_calls"]:
-            tool_results = []
-            
+            calls = []
             for tool_call in message["tool_calls"]:
                 func = tool_call["function"]
-                tool_name = func["name"]
-                arguments = json.loads(func["arguments"])
-                
-                # Execute the tool
-                tool_result = await execute_tool(tool_name, arguments)
+                calls.append((func["name"], orjson.loads(func["arguments"])))
+            
+            # Execute the tools concurrently - each call is independent
+            results = await asyncio.gather(
+                *(execute_tool(tool_name, arguments) for tool_name, arguments in calls),
+                return_exceptions=True
+            )
+            
+            tool_results = []
+            for (tool_name, arguments), tool_result in zip(calls, results):
+                if isinstance(tool_result, Exception):
+                    tool_result = {"error": str(tool_result)}
                 tool_results.append({
                     "tool": tool_name,
                     "arguments": arguments,
@@ -188,20 +306,35 @@ async def chat(request: ChatRequest):
                 messages.append({
                     "role": "tool",
                     "tool_call_id": tool_call["id"],
-                    "content": json.dumps(tool_results[i]["result"])
+                    "content": orjson.dumps(tool_results[i]["result"]).decode()
                 })
             
+            tool_calls = [{"name": tr["tool"], "arguments": tr["arguments"]} for tr in tool_results]
+            
+            # Stream the final response so the client can render it as it arrives
+            if request.stream:
+                return StreamingResponse(
+                    _stream_chat_response(messages, tools, tool_calls, tool_results),
+                    media_type="text/event-stream"
+                )
+            
             # Get final response
             final_result = await call_openrouter(messages, tools)
             final_message = final_result["choices"][0]["message"]["content"]
             
             return ChatResponse(
                 response=final_message,
-                tool_calls=[{"name": tc["function"]["name"], "arguments": json.loads(tc["function"]["arguments"])} for tc in message["tool_calls"]],
+                tool_calls=tool_calls,
                 tool_results=tool_results
             )
         
-        return ChatResponse(response=message.get("content", ""))
+        response = ChatResponse(response=message.get("content", ""))
+        if request.stream:
+            return StreamingResponse(
+                iter([_sse("token", {"content": response.response}), _sse("result", response.model_dump())]),
+                media_type="text/event-stream"
+            )
+        return response
     
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=str(e))
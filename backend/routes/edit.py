@@ -1,41 +1,40 @@
 """
 Edit routes for video processing operations
 """
+import asyncio
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+from typing import List, Union
 
 from services.videodb_client import get_videodb_client
+from routes._schemas import (
+    TrimRequest, TextOverlayRequest, TextOverlaysRequest, BatchEditRequest, EditResponse
+)
 
 router = APIRouter()
 
 
-class TrimRequest(BaseModel):
-    video_id: str
-    start: float
-    end: float
-
-
-class TextOverlayRequest(BaseModel):
-    video_id: str
-    text: str
-    start: float = 0
-    duration: float = 5
-    position: str = "center"
-
-
-class EditResponse(BaseModel):
-    stream_url: str
-    status: str = "success"
+async def _apply_edit(request: Union[TrimRequest, TextOverlayRequest]) -> EditResponse:
+    """Run a single edit operation against VideoDB"""
+    client = get_videodb_client()
+    if isinstance(request, TrimRequest):
+        result = await asyncio.to_thread(client.trim_video, request.video_id, request.start, request.end)
+    else:
+        result = await asyncio.to_thread(
+            client.add_text_overlay,
+            request.video_id,
+            request.text,
+            request.start,
+            request.duration,
+            request.position
+        )
+    return EditResponse(stream_url=result["stream_url"])
 
 
 @router.post("/edit/trim", response_model=EditResponse)
 async def trim_video(request: TrimRequest):
     """Trim video to specified start and end times"""
     try:
-        client = get_videodb_client()
-        result = client.trim_video(request.video_id, request.start, request.end)
-        return EditResponse(stream_url=result["stream_url"])
+        return await _apply_edit(request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -43,15 +42,33 @@ async def trim_video(request: TrimRequest):
 @router.post("/edit/text-overlay", response_model=EditResponse)
 async def add_text_overlay(request: TextOverlayRequest):
     """Add text overlay to video"""
+    try:
+        return await _apply_edit(request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/edit/text-overlays", response_model=EditResponse)
+async def add_text_overlays(request: TextOverlaysRequest):
+    """Add several text overlays to a video in a single render"""
     try:
         client = get_videodb_client()
-        result = client.add_text_overlay(
+        result = await asyncio.to_thread(
+            client.add_text_overlays,
             request.video_id,
-            request.text,
-            request.start,
-            request.duration,
-            request.position
+            [overlay.model_dump() for overlay in request.overlays],
+            request.video_start,
+            request.video_end
         )
         return EditResponse(stream_url=result["stream_url"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/edit/batch", response_model=List[EditResponse])
+async def batch_edit(request: BatchEditRequest):
+    """Run several edit operations concurrently, returning results in request order"""
+    try:
+        return await asyncio.gather(*(_apply_edit(op) for op in request.ops))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
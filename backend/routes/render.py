@@ -1,9 +1,12 @@
 """
 Render routes for final video output
 """
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from services.videodb_client import get_videodb_client
+
 router = APIRouter()
 
 
@@ -22,11 +25,9 @@ async def render_video(request: RenderRequest):
     """Render the final edited video"""
     # For now, we just return the stream URL from VideoDB
     # In a full implementation, this would handle complex timelines
-    from services.videodb_client import get_videodb_client
-    
     try:
         client = get_videodb_client()
-        video = client.get_video(request.video_id)
+        video = await asyncio.to_thread(client.get_video, request.video_id)
         return RenderResponse(
             stream_url=video.stream_url,
             status="rendered"
@@ -1,44 +1,47 @@
 """
 Upload routes for video and audio files
 """
+import asyncio
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+from typing import List
 
 from services.videodb_client import get_videodb_client
+from routes._schemas import UploadRequest, UploadResponse
 
 router = APIRouter()
 
 
-class UploadRequest(BaseModel):
-    url: str
-    name: Optional[str] = None
-
-
-class UploadResponse(BaseModel):
-    id: str
-    name: str
-    length: float
-    stream_url: Optional[str] = None
-
-
 @router.post("/upload/video", response_model=UploadResponse)
 async def upload_video(request: UploadRequest):
     """Upload a video from URL"""
     try:
         client = get_videodb_client()
-        result = client.upload_video(request.url, request.name)
+        result = await asyncio.to_thread(client.upload_video, request.url, request.name)
         return UploadResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/upload/videos", response_model=List[UploadResponse])
+async def upload_videos(requests: List[UploadRequest]):
+    """Upload several videos from URLs concurrently, returning results in request order"""
+    try:
+        client = get_videodb_client()
+        results = await asyncio.to_thread(
+            client.upload_videos,
+            [{"url": request.url, "name": request.name} for request in requests]
+        )
+        return [UploadResponse(**result) for result in results]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/upload/audio", response_model=UploadResponse)
 async def upload_audio(request: UploadRequest):
     """Upload audio from URL"""
     try:
         client = get_videodb_client()
-        result = client.upload_audio(request.url, request.name)
+        result = await asyncio.to_thread(client.upload_audio, request.url, request.name)
         return UploadResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -49,6 +52,6 @@ async def list_videos():
     """List all uploaded videos"""
     try:
         client = get_videodb_client()
-        return client.list_videos()
+        return await asyncio.to_thread(client.list_videos)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,13 @@
 """
 Video routes for timeline operations
 """
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from services.videodb_client import get_videodb_client
 from videodb.timeline import Timeline
-from videodb.asset import VideoAsset
+from videodb.asset import VideoAsset, AudioAsset
 
 router = APIRouter()
 
@@ -30,6 +31,25 @@ class TimelineRequest(BaseModel):
     clips: List[VideoClip]
     audio_clips: List[AudioClip] = []
 
+def _clip_to_asset(clip: VideoClip) -> VideoAsset:
+    asset_id = clip.source_id if clip.source_id else clip.id
+    start = clip.start if clip.start is not None else 0
+    end = clip.end if clip.end is not None and clip.end > start else None
+    return VideoAsset(asset_id=asset_id, start=start, end=end)
+
+
+def _audio_clip_to_asset(audio: AudioClip) -> AudioAsset:
+    # Source Trimming
+    return AudioAsset(
+        asset_id=audio.source_id if audio.source_id else audio.id,
+        start=audio.start,
+        end=audio.end,
+        disable_other_tracks=False, # Overlay, don't replace
+        fade_in_duration=1,
+        fade_out_duration=1
+    )
+
+
 @router.post("/video/render-timeline")
 async def render_timeline(request: TimelineRequest):
     """
@@ -43,42 +63,22 @@ async def render_timeline(request: TimelineRequest):
         timeline = Timeline(client.conn)
         
         # 1. Process Video Track (Sequential/Magnetic)
-        if request.clips:
-            for clip in request.clips:
-                asset_id = clip.source_id if clip.source_id else clip.id
-                start = clip.start if clip.start is not None else 0
-                end = clip.end if clip.end is not None and clip.end > start else None
-                
-                video_asset = VideoAsset(
-                    asset_id=asset_id,
-                    start=start,
-                    end=end
-                )
-                timeline.add_inline(video_asset)
+        video_assets = [_clip_to_asset(clip) for clip in request.clips]
         
         # 2. Process Audio Track (Overlays/Free Placement)
-        from videodb.asset import AudioAsset
-        if request.audio_clips:
-            for audio in request.audio_clips:
-                asset_id = audio.source_id if audio.source_id else audio.id
-                
-                # Source Trimming
-                audio_asset = AudioAsset(
-                    asset_id=asset_id,
-                    start=audio.start,
-                    end=audio.end,
-                    disable_other_tracks=False, # Overlay, don't replace
-                    fade_in_duration=1,
-                    fade_out_duration=1
-                )
-                
-                # Timeline Positioning
-                timeline.add_overlay(
-                    start=audio.timeline_start,
-                    asset=audio_asset
-                )
-            
-        stream_url = timeline.generate_stream()
+        audio_overlays = [
+            (audio.timeline_start, _audio_clip_to_asset(audio))  # Timeline Positioning
+            for audio in request.audio_clips
+        ]
+        
+        # add_inline/add_overlay only append locally; the single network call
+        # is generate_stream, which compiles the whole timeline at once
+        for video_asset in video_assets:
+            timeline.add_inline(video_asset)
+        for start, audio_asset in audio_overlays:
+            timeline.add_overlay(start=start, asset=audio_asset)
+        
+        stream_url = await asyncio.to_thread(timeline.generate_stream)
         
         return {
             "stream_url": stream_url,
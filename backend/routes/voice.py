@@ -3,52 +3,308 @@
 Voice Command Endpoint - STT → AI Chat → TTS Response
 """
 import os
-import shutil
-import uuid
+import re
+import asyncio
+import subprocess
+import threading
+import time
+import traceback
 import speech_recognition as sr
-from pydub import AudioSegment
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, StringConstraints
+from typing import Annotated, Dict, Iterator, Optional
+
+try:
+    from google.cloud import speech_v1 as speech
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    speech = None  # Falls back to SpeechRecognition's recognize_google
+
+from services.ffmpeg_service import FFMPEG_SEMAPHORE, get_ffmpeg_path
+from routes.chat import ChatRequest, chat
+
+from services.voice_gen import (
+    generate_voice_reply, generate_voice_reply_stream, tts_cache_key, tts_cache_path
+)
 
 router = APIRouter()
 
-TEMP_DIR = os.path.join(os.path.dirname(__file__), "..", "temp_storage")
-os.makedirs(TEMP_DIR, exist_ok=True)
+STT_SAMPLE_RATE = 16000
+STT_CHUNK_SIZE = 3200  # 100 ms of 16 kHz mono 16-bit PCM per streaming request
+
+
+def decode_pcm_cmd() -> list:
+    """Recorded audio in on stdin → 16 kHz mono 16-bit PCM out on stdout"""
+    return [
+        get_ffmpeg_path(),
+        "-hide_banner",
+        "-loglevel", "error",
+        "-i", "pipe:0",
+        "-ar", str(STT_SAMPLE_RATE),
+        "-ac", "1",
+        "-f", "s16le",
+        "pipe:1"
+    ]
+
+
+TTS_KEY_PATTERN = re.compile(r"[a-f0-9]{16}")
+# Reply URLs are content-addressed, so a given URL always returns the same audio
+TTS_RESPONSE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+# Voice replies this worker is still synthesizing, keyed by cache key; GET /voice/{key} waits on these
+_pending_tts: Dict[str, asyncio.Task] = {}
+# Other workers only see a reply in progress through its .pending marker file,
+# polled for at most TTS_PENDING_TIMEOUT seconds
+TTS_PENDING_TIMEOUT = 60
+TTS_PENDING_POLL = 0.1
+
+
+async def decode_to_pcm(data: bytes) -> bytes:
+    """
+    Decode recorded audio to 16 kHz mono 16-bit PCM, the format Google STT
+    expects. Audio goes through FFmpeg's stdin/stdout, never touching disk.
+    """
+    cmd = decode_pcm_cmd()
+    async with FFMPEG_SEMAPHORE:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            pcm, stderr = await asyncio.wait_for(proc.communicate(data), timeout=30)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(cmd, 30)
+    
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, pcm, stderr)
+    return pcm
 
 
-def generate_voice_reply(text: str) -> Optional[str]:
-    """Generate voice reply using ElevenLabs TTS"""
+def stream_pcm(data: bytes) -> Iterator[bytes]:
+    """
+    Decode recorded audio like decode_to_pcm, but yield PCM chunks as FFmpeg
+    produces them so streaming STT can start before decoding finishes.
+    """
+    proc = subprocess.Popen(
+        decode_pcm_cmd(),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    
+    def feed():
+        try:
+            proc.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            proc.stdin.close()
+    
+    # Feed stdin from a thread so a full stdout pipe can never deadlock us
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
     try:
-        from elevenlabs.client import ElevenLabs
-        
-        api_key = os.getenv("ELEVENLABS_API_KEY")
-        if not api_key:
-            print("⚠️ ELEVENLABS_API_KEY not set, skipping voice reply")
-            return None
-        
-        client = ElevenLabs(api_key=api_key)
-        
-        # Generate audio
-        audio_generator = client.text_to_speech.convert(
-            voice_id="21m00Tcm4TlvDq8ikWAM",  # Rachel voice
-            text=text,
-            model_id="eleven_monolingual_v1"
+        while chunk := proc.stdout.read(STT_CHUNK_SIZE):
+            yield chunk
+    finally:
+        proc.stdout.close()
+        writer.join()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# Created on startup when google-cloud-speech and credentials are available
+_speech_client = None
+
+
+def get_speech_client():
+    return _speech_client
+
+
+def create_speech_client():
+    """Build the streaming STT client; registered as an app startup hook in server.py"""
+    global _speech_client
+    if speech is None:
+        print("⚠️ google-cloud-speech not installed, using recognize_google for STT")
+        return
+    try:
+        _speech_client = speech.SpeechClient()
+        print("✅ Google Cloud streaming STT ready")
+    except Exception as e:
+        print(f"⚠️ Google Cloud STT unavailable ({e}), using recognize_google")
+
+
+def transcribe_streaming(client, data: bytes) -> str:
+    """Transcribe with Google Cloud streaming recognition, overlapping STT with decoding"""
+    streaming_config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=STT_SAMPLE_RATE,
+            language_code="en-US",
+            model="latest_short"
         )
+    )
+    requests = (
+        speech.StreamingRecognizeRequest(audio_content=chunk)
+        for chunk in stream_pcm(data)
+    )
+    
+    try:
+        responses = client.streaming_recognize(config=streaming_config, requests=requests)
+        transcript = " ".join(
+            result.alternatives[0].transcript.strip()
+            for response in responses
+            for result in response.results
+            if result.is_final and result.alternatives
+        )
+    except google_exceptions.GoogleAPICallError as e:
+        raise sr.RequestError(str(e))
+    
+    if not transcript:
+        raise sr.UnknownValueError()
+    return transcript
+
+
+async def transcribe(data: bytes) -> str:
+    """
+    Transcribe recorded audio, preferring Google Cloud streaming STT and
+    falling back to SpeechRecognition's recognize_google. Raises
+    sr.UnknownValueError / sr.RequestError like recognize_google does.
+    """
+    client = get_speech_client()
+    if client is not None:
+        # The gRPC stream and FFmpeg reader are blocking; keep them off the event loop
+        return await asyncio.to_thread(transcribe_streaming, client, data)
+    
+    pcm = await decode_to_pcm(data)
+    recognizer = sr.Recognizer()
+    audio_data = sr.AudioData(pcm, STT_SAMPLE_RATE, 2)
+    return await asyncio.to_thread(recognizer.recognize_google, audio_data)
+
+
+def tts_pending_path(key: str) -> str:
+    """Marker that exists while some worker is synthesizing this reply"""
+    return f"{tts_cache_path(key)}.pending"
+
+
+def claim_pending_marker(pending_path: str) -> bool:
+    """
+    Atomically create a .pending marker, so only one worker synthesizes a
+    given reply. A marker older than TTS_PENDING_TIMEOUT was left by a worker
+    that died mid-synthesis and is taken over.
+    """
+    for _ in range(2):
+        try:
+            os.close(os.open(pending_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(pending_path) < TTS_PENDING_TIMEOUT:
+                    return False
+                os.remove(pending_path)
+            except OSError:
+                pass  # Removed meanwhile; try to create it again
+    return False
+
+
+def start_voice_reply(text: str) -> Optional[str]:
+    """
+    Start synthesizing a voice reply in the background and return its cache
+    key right away, so the reply URL can be handed out before the audio exists.
+    Returns None when TTS is not configured.
+    """
+    if not os.getenv("ELEVENLABS_API_KEY"):
+        print("⚠️ ELEVENLABS_API_KEY not set, skipping voice reply")
+        return None
+    
+    key = tts_cache_key(text)
+    if key not in _pending_tts and not os.path.exists(tts_cache_path(key)):
+        pending_path = tts_pending_path(key)
+        if not claim_pending_marker(pending_path):
+            return key  # Another worker is synthesizing it; GET waits on its marker
         
-        # Save to file
-        output_filename = f"voice_reply_{uuid.uuid4().hex[:8]}.mp3"
-        output_path = os.path.join(TEMP_DIR, output_filename)
-        
-        with open(output_path, "wb") as f:
-            for chunk in audio_generator:
-                f.write(chunk)
-        
-        print(f"✅ Voice reply saved: {output_filename}")
-        return output_path
+        # Only the worker that created the marker removes it
+        def finish(_):
+            _pending_tts.pop(key, None)
+            try:
+                os.remove(pending_path)
+            except OSError:
+                pass
         
+        task = asyncio.create_task(generate_voice_reply(text))
+        _pending_tts[key] = task
+        task.add_done_callback(finish)
+    return key
+
+
+async def wait_for_pending_reply(key: str):
+    """Wait while another worker synthesizes this reply, up to TTS_PENDING_TIMEOUT"""
+    path = tts_cache_path(key)
+    pending_path = tts_pending_path(key)
+    deadline = asyncio.get_running_loop().time() + TTS_PENDING_TIMEOUT
+    while (
+        os.path.exists(pending_path)
+        and not os.path.exists(path)
+        and asyncio.get_running_loop().time() < deadline
+    ):
+        await asyncio.sleep(TTS_PENDING_POLL)
+
+
+@router.get("/voice/{key}")
+async def get_voice_reply(key: str):
+    """Serve a voice reply, waiting for it if synthesis is still in progress"""
+    if not TTS_KEY_PATTERN.fullmatch(key):
+        raise HTTPException(status_code=404, detail="Voice reply not found")
+    
+    task = _pending_tts.get(key)
+    if task is not None:
+        # Shield so a listener disconnecting doesn't cancel synthesis for others
+        await asyncio.shield(task)
+    else:
+        # With several uvicorn workers the synthesis may be running elsewhere
+        await wait_for_pending_reply(key)
+    
+    path = tts_cache_path(key)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Voice reply not found")
+    os.utime(path)  # Mark as recently used for pruning
+    # FileResponse answers Range requests itself, so players can seek
+    return FileResponse(path, media_type="audio/mpeg", headers=TTS_RESPONSE_HEADERS)
+
+
+class VoiceStreamRequest(BaseModel):
+    text: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+
+@router.post("/voice/stream")
+async def stream_voice_reply(request: VoiceStreamRequest):
+    """Speak text back as MP3, streamed sentence group by sentence group"""
+    # Wait for the first audio, so unconfigured or failing TTS is a proper
+    # error status; a later failure ends the stream early
+    stream = generate_voice_reply_stream(request.text)
+    try:
+        first = await anext(stream)
+    except StopAsyncIteration:
+        raise HTTPException(status_code=503, detail="Voice replies are not configured")
     except Exception as e:
-        print(f"❌ ElevenLabs error: {e}")
-        return None
+        raise HTTPException(status_code=502, detail=f"Voice generation failed: {e}")
+    
+    async def body():
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+    
+    return StreamingResponse(body(), media_type="audio/mpeg")
 
 
 @router.post("/voice-command")
@@ -66,75 +322,55 @@ async def voice_command(
     print("🎤 Receiving Voice Command...")
 
     try:
-        # A. Save uploaded audio
-        temp_audio_path = os.path.join(TEMP_DIR, f"temp_voice_{uuid.uuid4().hex[:8]}.webm")
-        with open(temp_audio_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
+        # A. Read uploaded audio (voice commands are short; keep them in memory)
+        data = await audio.read()
+        print(f"   Audio size: {len(data)} bytes")
         
-        # Check file size
-        file_size = os.path.getsize(temp_audio_path)
-        print(f"   Audio file size: {file_size} bytes")
-        
-        if file_size < 1000:
-            os.remove(temp_audio_path)
+        if len(data) < 1000:
             return {"status": "error", "message": "Recording too short. Hold the button longer."}
 
-        # B. Convert to WAV for SpeechRecognition
+        # B/C. Decode and transcribe (streamed into Google Cloud STT when available)
         try:
-            audio_segment = AudioSegment.from_file(temp_audio_path)
-            wav_path = temp_audio_path.replace(".webm", ".wav")
-            audio_segment.export(wav_path, format="wav")
-        except Exception as e:
+            text_command = await transcribe(data)
+            print(f"🗣️ Transcribed: '{text_command}'")
+        except sr.UnknownValueError:
+            return {"status": "error", "message": "Could not understand audio. Please speak clearly."}
+        except sr.RequestError:
+            return {"status": "error", "message": "Speech recognition service unavailable."}
+        except subprocess.SubprocessError as e:
             print(f"❌ Audio conversion error: {e}")
-            os.remove(temp_audio_path)
             return {"status": "error", "message": "Could not process audio file."}
+        except RuntimeError as e:
+            # FFmpeg isn't installed; only voice commands need it
+            print(f"❌ {e}")
+            return {"status": "error", "message": "Audio decoding is unavailable: FFmpeg is not installed."}
 
-        # C. Transcribe to Text
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(wav_path) as source:
-            audio_data = recognizer.record(source)
-            try:
-                text_command = recognizer.recognize_google(audio_data)
-                print(f"🗣️ Transcribed: '{text_command}'")
-            except sr.UnknownValueError:
-                return {"status": "error", "message": "Could not understand audio. Please speak clearly."}
-            except sr.RequestError:
-                return {"status": "error", "message": "Speech recognition service unavailable."}
-
-        # Cleanup temp files
-        for path in [temp_audio_path, wav_path]:
-            if os.path.exists(path):
-                os.remove(path)
-
-        # D. Send to AI Chat via HTTP
-        import httpx
-        
+        # D. Send to AI Chat (direct call - no loopback HTTP request)
         # Build the message with video context for better AI understanding
         user_message = text_command
         if video_id:
             user_message = f"[Working on video_id: {video_id}] {text_command}"
         
-        async with httpx.AsyncClient() as client:
-            chat_response = await client.post(
-                "http://localhost:8000/api/chat",
-                json={
-                    "messages": [{"role": "user", "content": user_message}],
-                    "video_context": {"current_video": {"id": video_id}} if video_id else None
-                },
-                timeout=30.0
-            )
-            chat_data = chat_response.json()
-        
-        response_text = chat_data.get("response", "I processed your request.")
-        tool_results = chat_data.get("tool_results", [])
+        chat_request = ChatRequest(
+            messages=[{"role": "user", "content": user_message}],
+            video_context={"current_video": {"id": video_id}} if video_id else None
+        )
+        try:
+            chat_result = await chat(chat_request)
+            response_text = chat_result.response
+            tool_results = chat_result.tool_results
+        except HTTPException as e:
+            print(f"❌ Chat error: {e.detail}")
+            response_text = "I processed your request."
+            tool_results = []
 
-        # E. Generate Voice Reply (ElevenLabs TTS)
-        voice_reply_path = generate_voice_reply(response_text)
+        # E. Generate Voice Reply (ElevenLabs TTS) in the background; the URL
+        # is derived from the cache key, so we can respond without waiting
+        voice_key = start_voice_reply(response_text)
         voice_reply_url = None
         
-        if voice_reply_path:
-            voice_filename = os.path.basename(voice_reply_path)
-            voice_reply_url = f"http://localhost:8000/files/{voice_filename}"
+        if voice_key:
+            voice_reply_url = f"http://localhost:8000/api/voice/{voice_key}"
 
         return {
             "status": "success",
@@ -146,6 +382,5 @@ async def voice_command(
 
     except Exception as e:
         print(f"❌ Voice Error: {e}")
-        import traceback
         traceback.print_exc()
         return {"status": "error", "message": str(e)}
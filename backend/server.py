@@ -2,19 +2,76 @@
 FastAPI server for AI Video Editing Agent
 """
 import os
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
 from dotenv import load_dotenv
 
-from routes import upload, edit, render, chat, voice
+from routes import upload, edit, render, chat, voice, audio, captions, video
+from services.http_client import get_http_client, close_http_client
+from services.videodb_client import get_videodb_client
+from services.voice_gen import warm_up_tts
 
 load_dotenv()
 
+async def warm_up_clients():
+    """Build the API clients and open their connections before the first request needs them"""
+    try:
+        await asyncio.to_thread(get_videodb_client)
+        print("🔥 VideoDB client ready")
+    except Exception as e:
+        print(f"⚠️ VideoDB warm-up failed: {e}")
+    
+    try:
+        if await warm_up_tts():
+            print("🔥 ElevenLabs connection ready")
+    except Exception as e:
+        print(f"⚠️ ElevenLabs warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up shared resources on startup and release them on shutdown"""
+    # Blocking VideoDB SDK calls run via asyncio.to_thread; size the pool so
+    # concurrent uploads/edits don't queue behind the small default executor
+    max_workers = int(os.getenv("BLOCKING_IO_WORKERS", "32"))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking-io")
+    asyncio.get_running_loop().set_default_executor(executor)
+    
+    voice.create_speech_client()
+    
+    # One pooled client for all outbound API calls (OpenRouter, ...)
+    get_http_client()
+    
+    # Runs in the background so startup isn't held up by the API handshakes
+    warm_up = None
+    if os.getenv("WARMUP", "1") == "1":
+        warm_up = asyncio.create_task(warm_up_clients())
+    
+    audio.start_merged_file_expiry()
+    
+    try:
+        yield
+    finally:
+        audio.stop_merged_file_expiry()
+        
+        if warm_up and not warm_up.done():
+            warm_up.cancel()
+        
+        await close_http_client()
+
+
 app = FastAPI(
     title="AI Video Editor API",
     description="Backend for AI-powered video editing with VideoDB",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS for frontend
@@ -26,10 +83,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Static file serving for voice responses
+class SelectiveGZipMiddleware:
+    """
+    GZip JSON responses but leave media alone: videos and mp3s are already
+    compressed and Range responses must stay byte-exact. Event streams are
+    skipped by GZipMiddleware itself, by response Content-Type (starlette>=0.46).
+    """
+    
+    def __init__(self, app, minimum_size: int = 1024, exclude_paths: tuple = ()):
+        self.app = app
+        self.gzip_app = GZipMiddleware(app, minimum_size=minimum_size)
+        self.exclude_paths = tuple(exclude_paths)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not self._skip(scope):
+            await self.gzip_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+    
+    def _skip(self, scope) -> bool:
+        if scope["path"].startswith(self.exclude_paths):
+            return True
+        return "range" in Headers(scope=scope)
+
+
+# Compress chat/caption JSON; media endpoints are served as-is
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    minimum_size=1024,
+    exclude_paths=("/files", "/api/audio/merged", "/api/voice/")
+)
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    Static files whose names are unique per content (UUIDs or content hashes),
+    so browsers may cache them forever. StaticFiles already sends ETag and
+    Last-Modified and answers conditional requests with 304.
+    
+    When FILES_ACCEL_REDIRECT is set (e.g. "/protected-files/"), responses carry
+    only an X-Accel-Redirect header and a fronting nginx sends the bytes.
+    """
+    
+    cache_control = "public, max-age=31536000, immutable"
+    
+    def __init__(self, *args, accel_redirect: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accel_redirect = accel_redirect
+    
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        if self.accel_redirect:
+            relative_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+            return Response(headers={
+                "X-Accel-Redirect": self.accel_redirect + relative_path,
+                "Cache-Control": self.cache_control
+            })
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers.setdefault("Cache-Control", self.cache_control)
+        return response
+
+
+# Static file serving for rendered videos
 TEMP_DIR = os.path.join(os.path.dirname(__file__), "temp_storage")
 os.makedirs(TEMP_DIR, exist_ok=True)
-app.mount("/files", StaticFiles(directory=TEMP_DIR), name="files")
+app.mount(
+    "/files",
+    ImmutableStaticFiles(directory=TEMP_DIR, accel_redirect=os.getenv("FILES_ACCEL_REDIRECT")),
+    name="files"
+)
 
 # Include routers
 app.include_router(upload.router, prefix="/api", tags=["upload"])
@@ -37,6 +157,9 @@ app.include_router(edit.router, prefix="/api", tags=["edit"])
 app.include_router(render.router, prefix="/api", tags=["render"])
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(voice.router, prefix="/api", tags=["voice"])
+app.include_router(audio.router, prefix="/api", tags=["audio"])
+app.include_router(captions.router, prefix="/api", tags=["captions"])
+app.include_router(video.router, prefix="/api", tags=["video"])
 
 
 @app.get("/health")
@@ -3,10 +3,36 @@ FFmpeg service for local audio/video merging
 """
 import os
 import glob
+import json
+import asyncio
 import tempfile
 import subprocess
+from functools import lru_cache
+from typing import AsyncIterator, Optional
 import httpx
 
+# Remembers where ffmpeg was found so later boots skip the WinGet scan
+FFMPEG_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "deltahacks12", "ffmpeg.json")
+
+
+def _read_cached_ffmpeg():
+    try:
+        with open(FFMPEG_CACHE_FILE) as f:
+            path = json.load(f).get("ffmpeg")
+    except (OSError, ValueError, AttributeError):
+        return None
+    return path if path and os.path.exists(path) else None
+
+
+def _write_cached_ffmpeg(path: str):
+    try:
+        os.makedirs(os.path.dirname(FFMPEG_CACHE_FILE), exist_ok=True)
+        with open(FFMPEG_CACHE_FILE, "w") as f:
+            json.dump({"ffmpeg": path}, f)
+    except OSError:
+        pass
+
+
 # Find ffmpeg path - check winget installation or use PATH
 def find_ffmpeg():
     # Check if in PATH first
@@ -17,16 +43,21 @@ def find_ffmpeg():
     except:
         pass
     
-    # Check winget installation paths (recursive search)
+    # Reuse the location found on a previous boot
+    cached_path = _read_cached_ffmpeg()
+    if cached_path:
+        return cached_path
+    
+    # Check winget installation paths (recursive search, stops at first match)
     user_home = os.path.expanduser("~")
     winget_base = os.path.join(user_home, "AppData", "Local", "Microsoft", "WinGet", "Packages")
     
     if os.path.exists(winget_base):
-        for root, dirs, files in os.walk(winget_base):
-            if "ffmpeg.exe" in files:
-                ffmpeg_path = os.path.join(root, "ffmpeg.exe")
-                print(f"[FFmpeg] Found at: {ffmpeg_path}")
-                return ffmpeg_path
+        ffmpeg_path = next(glob.iglob(os.path.join(winget_base, "**", "ffmpeg.exe"), recursive=True), None)
+        if ffmpeg_path:
+            print(f"[FFmpeg] Found at: {ffmpeg_path}")
+            _write_cached_ffmpeg(ffmpeg_path)
+            return ffmpeg_path
     
     # Check common install locations on Windows
     common_paths = [
@@ -40,56 +71,209 @@ def find_ffmpeg():
     
     raise RuntimeError("FFmpeg not found! Install with: winget install ffmpeg")
 
-FFMPEG_PATH = find_ffmpeg()
-print(f"[FFmpeg] Using: {FFMPEG_PATH}")
 
+@lru_cache(maxsize=None)
+def get_ffmpeg_path() -> str:
+    """
+    Locate ffmpeg on first use rather than at import, so the API still starts
+    without it and only the routes that need it fail. Raises RuntimeError
+    (and tries again next call) while ffmpeg is missing.
+    """
+    path = find_ffmpeg()
+    print(f"[FFmpeg] Using: {path}")
+    return path
+
+
+def get_ffprobe_path() -> str:
+    # ffprobe ships alongside ffmpeg in every distribution we look for
+    ffmpeg_dir, ffmpeg_name = os.path.split(get_ffmpeg_path())
+    return os.path.join(ffmpeg_dir, ffmpeg_name.replace("ffmpeg", "ffprobe"))
+
+
+@lru_cache(maxsize=None)
+def detect_hw_encoder():
+    """
+    Pick a hardware H.264 encoder if this machine has one. Being listed in
+    `-encoders` only means ffmpeg was built with it, so each candidate also
+    has to encode a few frames before we trust it.
+    Set FFMPEG_HW_ENCODER to force an encoder, or to "none" to disable.
+    Runs on the first encode rather than at import, then the result is reused.
+    """
+    override = os.getenv("FFMPEG_HW_ENCODER")
+    if override:
+        return None if override.lower() == "none" else override
+    
+    try:
+        result = subprocess.run(
+            [get_ffmpeg_path(), "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    
+    for encoder in ("h264_nvenc", "h264_videotoolbox", "h264_qsv"):
+        if encoder not in result.stdout:
+            continue
+        try:
+            check = subprocess.run(
+                [
+                    get_ffmpeg_path(), "-hide_banner", "-loglevel", "error",
+                    "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+                    "-c:v", encoder, "-f", "null", "-"
+                ],
+                capture_output=True, timeout=10
+            )
+        except (OSError, subprocess.SubprocessError):
+            continue
+        if check.returncode == 0:
+            print(f"[FFmpeg] Hardware encoder: {encoder}")
+            return encoder
+    print("[FFmpeg] Hardware encoder: none (libx264)")
+    return None
+
+
+# Settings for each hardware encoder: low latency for previews, higher
+# quality for final renders
+HW_ENCODER_ARGS = {
+    "h264_nvenc": {
+        "preview": ["-preset", "p1", "-tune", "ll", "-b:v", "5M"],
+        "final": ["-preset", "p5", "-tune", "hq", "-rc", "vbr", "-cq", "23", "-b:v", "0"],
+    },
+    "h264_videotoolbox": {
+        "preview": ["-realtime", "1", "-b:v", "5M"],
+        "final": ["-b:v", "10M"],
+    },
+    "h264_qsv": {
+        "preview": ["-preset", "veryfast", "-b:v", "5M"],
+        "final": ["-preset", "slow", "-global_quality", "23"],
+    },
+}
+
+
+def video_encoder_args(quality: str = "preview") -> list:
+    """Video encoder flags for quality "preview" or "final": hardware when available, else libx264"""
+    hw_encoder = detect_hw_encoder()
+    if hw_encoder:
+        settings = HW_ENCODER_ARGS.get(hw_encoder, {})
+        return ["-c:v", hw_encoder, *settings.get(quality, settings.get("preview", ["-b:v", "5M"]))]
+    if quality == "final":
+        return ["-c:v", "libx264", "-preset", "fast", "-crf", "23", "-threads", "0"]
+    return ["-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency", "-crf", "28", "-threads", "0"]
+
+# Audio codecs each output container can take as-is; anything else is re-encoded to AAC
+COPYABLE_AUDIO_CODECS = {
+    ".mp4": {"aac"},
+    ".mov": {"aac"},
+    ".mkv": {"aac", "mp3", "opus", "vorbis", "flac"},
+}
+
+# Bound concurrent FFmpeg processes so a burst of requests can't oversubscribe the CPU
+FFMPEG_SEMAPHORE = asyncio.Semaphore(int(os.getenv("FFMPEG_CONCURRENCY", os.cpu_count() or 4)))
+
+
+async def run_ffmpeg(cmd: list, timeout: float = 120, check: bool = False) -> str:
+    """
+    Run an FFmpeg command without blocking the event loop, returning its stderr.
+    With check=True a non-zero exit raises RuntimeError carrying the stderr.
+    """
+    async with FFMPEG_SEMAPHORE:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise RuntimeError(f"FFmpeg timed out after {timeout}s")
+    stderr = stderr.decode(errors="replace")
+    if check and proc.returncode != 0:
+        raise RuntimeError(stderr or f"FFmpeg exited with code {proc.returncode}")
+    return stderr
 
-def download_video_with_ffmpeg(stream_url: str, output_path: str):
+
+async def download_video_with_ffmpeg(stream_url: str, output_path: str):
     """Download video from stream URL (supports HLS/m3u8) using FFmpeg"""
     cmd = [
-        FFMPEG_PATH,
+        get_ffmpeg_path(),
         '-hide_banner',
+        '-loglevel', 'error',
+        '-nostdin',
         '-y',
         '-protocol_whitelist', 'file,http,https,tcp,tls,crypto',
         '-allowed_extensions', 'ALL',
         '-i', stream_url,
         '-c', 'copy',
         '-bsf:a', 'aac_adtstoasc',
+        '-movflags', '+faststart',
         output_path
     ]
     
     print(f"[FFmpeg] Downloading: {stream_url[:80]}...")
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+    stderr = await run_ffmpeg(cmd)
     
     # Check if output file was created and has content
     if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-        error_msg = result.stderr if result.stderr else "Unknown error - no output file created"
+        error_msg = stderr if stderr else "Unknown error - no output file created"
         print(f"[FFmpeg] Download failed: {error_msg[:500]}")
         raise RuntimeError(f"Download failed: {error_msg[:300]}")
     
     print(f"[FFmpeg] Downloaded to: {output_path} ({os.path.getsize(output_path)} bytes)")
 
 
-def merge_audio_video(video_path: str, audio_path: str, output_path: str) -> str:
+async def get_audio_codec(path: str) -> Optional[str]:
+    """Return the codec name of a file's first audio stream, or None if it can't be probed"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            get_ffprobe_path(),
+            '-v', 'error',
+            '-select_streams', 'a:0',
+            '-show_entries', 'stream=codec_name',
+            '-of', 'json',
+            path,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=30)
+        streams = json.loads(stdout or b"{}").get("streams") or []
+    except (OSError, ValueError, asyncio.TimeoutError):
+        return None
+    return streams[0].get("codec_name") if streams else None
+
+
+async def merge_audio_video(video_path: str, audio_path: str, output_path: str) -> str:
     """Merge audio with video using FFmpeg"""
+    # Remux the audio untouched when the output container supports its codec
+    codec = await get_audio_codec(audio_path)
+    copyable = COPYABLE_AUDIO_CODECS.get(os.path.splitext(output_path)[1].lower(), set())
+    audio_codec = 'copy' if codec in copyable else 'aac'
+    
     cmd = [
-        FFMPEG_PATH,
+        get_ffmpeg_path(),
         '-hide_banner',  # Suppress version info
+        '-loglevel', 'error',
+        '-nostdin',
         '-y',
         '-i', video_path,
         '-i', audio_path,
         '-c:v', 'copy',
-        '-c:a', 'aac',
+        '-c:a', audio_codec,
+        '-threads', '0',
         '-shortest',
+        '-movflags', '+faststart',
         output_path
     ]
     
-    print(f"[FFmpeg] Merging audio...")
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+    print(f"[FFmpeg] Merging audio (audio codec: {codec} → {audio_codec})...")
+    stderr = await run_ffmpeg(cmd)
     
     # Check if output file was created
     if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-        error_msg = result.stderr if result.stderr else "Unknown merge error"
+        error_msg = stderr if stderr else "Unknown merge error"
         print(f"[FFmpeg] Merge failed: {error_msg[:200]}")
         raise RuntimeError(f"Merge failed: {error_msg[:200]}")
     
@@ -112,10 +296,10 @@ async def merge_audio_with_video_stream(
     
     try:
         # Download video using FFmpeg (supports HLS/m3u8)
-        download_video_with_ffmpeg(video_stream_url, video_temp.name)
+        await download_video_with_ffmpeg(video_stream_url, video_temp.name)
         
         # Merge audio
-        merge_audio_video(video_temp.name, audio_file_path, output_temp.name)
+        await merge_audio_video(video_temp.name, audio_file_path, output_temp.name)
         
         return output_temp.name
         
@@ -123,3 +307,85 @@ async def merge_audio_with_video_stream(
         # Clean up video temp (keep output for serving)
         if os.path.exists(video_temp.name):
             os.unlink(video_temp.name)
+
+
+async def merge_audio_stream_with_video_stream(
+    video_stream_url: str,
+    audio_chunks: AsyncIterator[bytes],
+) -> str:
+    """
+    Download video from stream and merge it with audio fed to FFmpeg over stdin.
+    Avoids writing the audio to disk first; the input must be a streamable
+    format (mp3, wav, webm, ogg, ...), not MP4-family containers.
+    """
+    video_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
+    output_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
+    video_temp.close()
+    output_temp.close()
+    
+    try:
+        await download_video_with_ffmpeg(video_stream_url, video_temp.name)
+        
+        cmd = [
+            get_ffmpeg_path(),
+            '-hide_banner',
+            '-loglevel', 'error',
+            '-y',
+            '-i', video_temp.name,
+            '-i', 'pipe:0',
+            '-c:v', 'copy',
+            '-c:a', 'aac',
+            '-threads', '0',
+            '-shortest',
+            '-movflags', '+faststart',
+            output_temp.name
+        ]
+        
+        print(f"[FFmpeg] Merging piped audio...")
+        async with FFMPEG_SEMAPHORE:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            # Drain stderr concurrently so FFmpeg never blocks on a full pipe
+            stderr_task = asyncio.create_task(proc.stderr.read())
+            
+            try:
+                async for chunk in audio_chunks:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # FFmpeg exited early; the error is reported from stderr below
+                pass
+            finally:
+                proc.stdin.close()
+            
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=120)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                stderr_task.cancel()
+                raise RuntimeError("Merge failed: FFmpeg timed out after 120s")
+        stderr = (await stderr_task).decode(errors="replace")
+        
+        # A killed or failed FFmpeg can still leave a partial output behind
+        if proc.returncode != 0 or not os.path.exists(output_temp.name) or os.path.getsize(output_temp.name) == 0:
+            error_msg = stderr or f"FFmpeg exited with code {proc.returncode}"
+            print(f"[FFmpeg] Merge failed: {error_msg[:200]}")
+            raise RuntimeError(f"Merge failed: {error_msg[:200]}")
+        
+        print(f"[FFmpeg] Success! Output: {output_temp.name} ({os.path.getsize(output_temp.name)} bytes)")
+        return output_temp.name
+    
+    except BaseException:
+        # Never leave a partial merge behind
+        if os.path.exists(output_temp.name):
+            os.unlink(output_temp.name)
+        raise
+        
+    finally:
+        if os.path.exists(video_temp.name):
+            os.unlink(video_temp.name)
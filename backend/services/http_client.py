@@ -0,0 +1,29 @@
+"""
+Shared HTTP client for outbound API calls (OpenRouter, ElevenLabs, ...)
+"""
+from typing import Optional
+import httpx
+
+
+# Singleton instance - one connection pool so TLS sessions are reused across requests
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the shared AsyncClient"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+        )
+    return _client
+
+
+async def close_http_client():
+    """Close the shared AsyncClient, if one was created"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -4,15 +4,34 @@ OpenRouter AI Service for Video Editing Commands
 Parses user commands into structured actions using OpenRouter LLM.
 """
 import os
-import json
-import httpx
+import orjson
+from typing import List
 from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+from services.http_client import get_http_client
 
 load_dotenv()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
+
+class EditAction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    tool: str
+    params: dict = {}
+
+
+class EditActionsResponse(BaseModel):
+    """Shape the model is prompted to return; parsed and validated in one pass"""
+    model_config = ConfigDict(extra="ignore")
+    
+    actions: List[EditAction] = []
+    explanation: str = "Command processed."
+
+
 SYSTEM_PROMPT = """
 You are **Frame**, an advanced AI video editing assistant. 
 Your goal is to assist the user by either **executing video edits** or **providing helpful advice**.
@@ -98,52 +117,44 @@ async def get_edit_actions(user_command: str) -> dict:
         }
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{OPENROUTER_BASE_URL}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "http://localhost:3000",
-                    "X-Title": "Frame AI Video Editor"
-                },
-                json={
-                    "model": "anthropic/claude-3.5-sonnet",
-                    "messages": [
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": user_command}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 500
-                },
-                timeout=30.0
-            )
-            
-            response.raise_for_status()
-            data = response.json()
-            
-            # Extract content
-            content = data["choices"][0]["message"]["content"]
-            
-            # Parse JSON from response
-            # Handle potential markdown wrapping
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-            content = content.strip()
-            
-            result = json.loads(content)
-            
-            # Validate structure
-            if "actions" not in result:
-                result["actions"] = []
-            if "explanation" not in result:
-                result["explanation"] = "Command processed."
-                
-            return result
-            
-    except json.JSONDecodeError as e:
+        client = get_http_client()
+        response = await client.post(
+            f"{OPENROUTER_BASE_URL}/chat/completions",
+            headers={
+                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "http://localhost:3000",
+                "X-Title": "Frame AI Video Editor"
+            },
+            json={
+                "model": "anthropic/claude-3.5-sonnet",
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_command}
+                ],
+                "temperature": 0.3,
+                "max_tokens": 500
+            }
+        )
+        
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        
+        # Extract content
+        content = data["choices"][0]["message"]["content"]
+        
+        # Parse JSON from response
+        # Handle potential markdown wrapping
+        if content.startswith("```"):
+            content = content.split("```")[1]
+            if content.startswith("json"):
+                content = content[4:]
+        content = content.strip()
+        
+        # Parse and validate in a single pass; missing keys get their defaults
+        return EditActionsResponse.model_validate_json(content).model_dump()
+        
+    except ValidationError as e:
         print(f"❌ JSON parse error: {e}")
         return {
             "actions": [],
@@ -162,9 +173,20 @@ async def get_edit_actions(user_command: str) -> dict:
 # =========================
 if __name__ == "__main__":
     import asyncio
+    import time
+    from services.http_client import close_http_client
     
     async def test():
         result = await get_edit_actions("Make the video black and white")
-        print(json.dumps(result, indent=2))
+        print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
     
-    asyncio.run(test())
+    # Reuse one loop so the shared HTTP client keeps its OpenRouter connection between runs
+    loop = asyncio.new_event_loop()
+    try:
+        for run in range(int(os.getenv("RUNS", "1"))):
+            started = time.perf_counter()
+            loop.run_until_complete(test())
+            print(f"⏱️ Run {run + 1}: {time.perf_counter() - started:.3f}s")
+    finally:
+        loop.run_until_complete(close_http_client())
+        loop.close()
@@ -6,55 +6,122 @@ Handles trim, speed, filters, adjustments, and stitching operations.
 import os
 import uuid
 import asyncio
+import tempfile
 import subprocess
 import json
+from functools import lru_cache
+
+from services.ffmpeg_service import get_ffmpeg_path, get_ffprobe_path, run_ffmpeg, video_encoder_args
+
+# Renders can run far longer than the merges run_ffmpeg's default timeout is sized for
+RENDER_TIMEOUT = 600
+
+# Stitched clips that don't share codecs/geometry are normalized to this
+STITCH_WIDTH = 1280
+STITCH_HEIGHT = 720
+STITCH_FPS = 30
+STITCH_SAMPLE_RATE = 48000
 
 # Temp storage for processed files
 TEMP_DIR = os.path.join(os.path.dirname(__file__), "..", "temp_storage")
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Intermediates and in-progress outputs live here, outside the public /files
+# mount; it sits next to TEMP_DIR so finished files can be os.replace'd across
+WORK_DIR = os.path.join(os.path.dirname(__file__), "..", "temp_work")
+os.makedirs(WORK_DIR, exist_ok=True)
 
-def get_video_duration(filepath: str) -> float:
-    """Get video duration in seconds using ffprobe."""
+
+PROBE_TIMEOUT = 30
+
+# What probe() reports for a file it can't read
+EMPTY_PROBE = {
+    "duration": 0.0, "has_audio": False, "vcodec": None, "acodec": None,
+    "width": None, "height": None, "fps": None, "sample_rate": None
+}
+
+
+@lru_cache(maxsize=256)
+def _probe(filepath: str, mtime: float) -> dict:
+    # mtime is part of the cache key so a rewritten file is probed again.
+    # Failures raise instead of returning, so lru_cache never stores them
+    result = subprocess.run(
+        [
+            get_ffprobe_path(), "-v", "error",
+            "-show_format", "-show_streams",
+            "-of", "json", filepath
+        ],
+        capture_output=True, text=True, timeout=PROBE_TIMEOUT, check=True
+    )
+    data = json.loads(result.stdout)
+    
+    streams = data.get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), None)
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
     try:
-        result = subprocess.run(
-            [
-                "ffprobe", "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "json", filepath
-            ],
-            capture_output=True, text=True
-        )
-        data = json.loads(result.stdout)
-        return float(data["format"]["duration"])
+        duration = float(data["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        duration = 0.0
+    
+    return {
+        "duration": duration,
+        "has_audio": audio is not None,
+        "vcodec": video.get("codec_name") if video else None,
+        "acodec": audio.get("codec_name") if audio else None,
+        "width": video.get("width") if video else None,
+        "height": video.get("height") if video else None,
+        "fps": video.get("r_frame_rate") if video else None,
+        "sample_rate": audio.get("sample_rate") if audio else None
+    }
+
+
+def probe(filepath: str) -> dict:
+    """Get duration, audio presence and codecs with a single ffprobe call."""
+    try:
+        return _probe(filepath, os.path.getmtime(filepath))
     except Exception as e:
         print(f"❌ ffprobe error: {e}")
-        return 0.0
+        return dict(EMPTY_PROBE)
+
+
+def get_video_duration(filepath: str) -> float:
+    """Get video duration in seconds using ffprobe."""
+    return probe(filepath)["duration"]
 
 
 def has_audio_stream(filepath: str) -> bool:
     """Check if video has audio stream."""
-    try:
-        result = subprocess.run(
-            [
-                "ffprobe", "-v", "error",
-                "-select_streams", "a",
-                "-show_entries", "stream=codec_type",
-                "-of", "json", filepath
-            ],
-            capture_output=True, text=True
-        )
-        data = json.loads(result.stdout)
-        return len(data.get("streams", [])) > 0
-    except Exception:
-        return False
+    return probe(filepath)["has_audio"]
+
+
+@lru_cache(maxsize=64)
+def speed_filters(factor: float) -> tuple:
+    """
+    Build the (setpts, atempo chain) filters for a playback speed factor.
+    Callers round the factor so common speeds hit the cache.
+    """
+    if factor <= 0:
+        raise ValueError(f"Speed factor must be positive, got {factor}")
+    
+    # atempo only accepts 0.5-2.0, so chain for extreme values
+    current = factor
+    atempo_chain = []
+    while current > 2.0:
+        atempo_chain.append("atempo=2.0")
+        current /= 2.0
+    while current < 0.5:
+        atempo_chain.append("atempo=0.5")
+        current *= 2.0
+    atempo_chain.append(f"atempo={current}")
+    return f"setpts={1/factor}*PTS", tuple(atempo_chain)
 
 
 async def process_video(
     input_path: str,
     actions: list,
     clip_start: float = 0.0,
-    clip_duration: float = None
+    clip_duration: float = None,
+    quality: str = "preview"
 ) -> dict | None:
     """
     Process video with AI-generated actions.
@@ -64,6 +131,7 @@ async def process_video(
         actions: List of action dicts with 'tool' and 'params'
         clip_start: Start time for timeline trim
         clip_duration: Duration for timeline trim
+        quality: "preview" for fast low-latency encoding, "final" for full quality
         
     Returns:
         Dict with 'path' and 'duration', or None if failed
@@ -74,8 +142,9 @@ async def process_video(
 
     output_filename = f"processed_{uuid.uuid4()}.mp4"
     output_path = os.path.join(TEMP_DIR, output_filename)
+    work_path = os.path.join(WORK_DIR, output_filename)
     
-    has_audio = has_audio_stream(input_path)
+    has_audio = (await asyncio.to_thread(probe, input_path))["has_audio"]
     
     # Build FFmpeg filter chains
     video_filters = []
@@ -97,20 +166,11 @@ async def process_video(
             pass
             
         elif tool == "speed":
-            factor = float(params.get("factor", 1.0))
+            factor = round(float(params.get("factor", 1.0)), 3)
             if factor != 1.0:
-                video_filters.append(f"setpts={1/factor}*PTS")
+                setpts, atempo_chain = speed_filters(factor)
+                video_filters.append(setpts)
                 if has_audio:
-                    # atempo only accepts 0.5-2.0, so chain for extreme values
-                    current = factor
-                    atempo_chain = []
-                    while current > 2.0:
-                        atempo_chain.append("atempo=2.0")
-                        current /= 2.0
-                    while current < 0.5:
-                        atempo_chain.append("atempo=0.5")
-                        current *= 2.0
-                    atempo_chain.append(f"atempo={current}")
                     audio_filters.extend(atempo_chain)
                     
         elif tool == "filter":
@@ -142,45 +202,61 @@ async def process_video(
                 audio_filters.append("loudnorm")
 
     # Build FFmpeg command
-    cmd = ["ffmpeg", "-y", "-i", input_path]
-    
-    # Add seek/duration for timeline trim
-    if clip_start > 0:
-        cmd.extend(["-ss", str(clip_start)])
-    if clip_duration:
-        cmd.extend(["-t", str(clip_duration)])
-    
-    # Add filters
-    filter_complex = []
-    if video_filters:
-        filter_complex.append(",".join(video_filters))
+    cmd = [get_ffmpeg_path(), "-hide_banner", "-nostdin", "-y"]
     
-    if filter_complex:
-        cmd.extend(["-vf", ",".join(filter_complex)])
-    
-    if audio_filters and has_audio:
-        cmd.extend(["-af", ",".join(audio_filters)])
-    elif not has_audio:
-        cmd.extend(["-an"])
-    
-    # Output settings
-    cmd.extend([
-        "-c:v", "libx264",
-        "-preset", "fast",
-        "-crf", "23",
-        "-c:a", "aac" if has_audio else "copy",
-        output_path
-    ])
+    if not video_filters and not audio_filters:
+        # Nothing to re-render (timeline trim only): seek on the input and
+        # remux the streams as-is instead of re-encoding
+        if clip_start > 0:
+            cmd.extend(["-ss", str(clip_start)])
+        if clip_duration:
+            cmd.extend(["-t", str(clip_duration)])
+        cmd.extend([
+            "-i", input_path,
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-movflags", "+faststart",
+            work_path
+        ])
+    else:
+        cmd.extend(["-i", input_path])
+        
+        # Add seek/duration for timeline trim (after -i for frame-accurate cuts)
+        if clip_start > 0:
+            cmd.extend(["-ss", str(clip_start)])
+        if clip_duration:
+            cmd.extend(["-t", str(clip_duration)])
+        
+        # Add filters
+        if video_filters:
+            cmd.extend(["-vf", ",".join(video_filters)])
+        
+        if audio_filters and has_audio:
+            cmd.extend(["-af", ",".join(audio_filters)])
+        elif not has_audio:
+            cmd.extend(["-an"])
+        
+        # Output settings (the first call probes for a hardware encoder, so
+        # it runs off the event loop)
+        cmd.extend([
+            *await asyncio.to_thread(video_encoder_args, quality),
+            "-c:a", "aac" if has_audio else "copy",
+            "-movflags", "+faststart",
+            work_path
+        ])
     
     try:
         print(f"🎬 Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"❌ FFmpeg error: {result.stderr}")
+        try:
+            await run_ffmpeg(cmd, timeout=RENDER_TIMEOUT, check=True)
+        except RuntimeError as e:
+            print(f"❌ FFmpeg error: {e}")
             return None
+        
+        # Only complete files ever appear under /files
+        os.replace(work_path, output_path)
             
-        duration = get_video_duration(output_path)
+        duration = (await asyncio.to_thread(probe, output_path))["duration"]
         print(f"✅ Processed: {output_path} ({duration:.2f}s)")
         
         return {"path": output_path, "duration": duration}
@@ -188,6 +264,50 @@ async def process_video(
     except Exception as e:
         print(f"❌ Processing error: {e}")
         return None
+    
+    finally:
+        if os.path.exists(work_path):
+            os.remove(work_path)
+
+
+def _concat_signature(info: dict) -> tuple:
+    """Stream properties that must match for the concat demuxer to stream-copy"""
+    return (
+        info["vcodec"], info["width"], info["height"], info["fps"],
+        info["acodec"], info["sample_rate"]
+    )
+
+
+def _concat_filter(infos: list) -> tuple:
+    """
+    Build a concat filter graph that normalizes every input to the same
+    resolution, frame rate, pixel format and sample rate. Inputs without
+    audio get silence so the audio track stays in sync.
+    Returns (filter_complex, has_audio).
+    """
+    has_audio = any(info["has_audio"] for info in infos)
+    parts = []
+    segments = []
+    for i, info in enumerate(infos):
+        parts.append(
+            f"[{i}:v]scale={STITCH_WIDTH}:{STITCH_HEIGHT}:force_original_aspect_ratio=decrease,"
+            f"pad={STITCH_WIDTH}:{STITCH_HEIGHT}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={STITCH_FPS},format=yuv420p[v{i}]"
+        )
+        segments.append(f"[v{i}]")
+        if has_audio:
+            if info["has_audio"]:
+                parts.append(
+                    f"[{i}:a]aresample={STITCH_SAMPLE_RATE},aformat=channel_layouts=stereo[a{i}]"
+                )
+            else:
+                parts.append(
+                    f"anullsrc=r={STITCH_SAMPLE_RATE}:cl=stereo,atrim=duration={info['duration']}[a{i}]"
+                )
+            segments.append(f"[a{i}]")
+    
+    outputs = "[v][a]" if has_audio else "[v]"
+    parts.append(f"{''.join(segments)}concat=n={len(infos)}:v=1:a={int(has_audio)}{outputs}")
+    return ";".join(parts), has_audio
 
 
 async def stitch_videos(clips: list) -> str | None:
@@ -206,40 +326,67 @@ async def stitch_videos(clips: list) -> str | None:
     output_filename = f"rendered_{uuid.uuid4()}.mp4"
     output_path = os.path.join(TEMP_DIR, output_filename)
     
-    # Create concat file
-    concat_file = os.path.join(TEMP_DIR, f"concat_{uuid.uuid4()}.txt")
+    filepaths = []
+    for clip in clips:
+        # Extract filename from URL or path
+        url = clip.get("url", "")
+        if url.startswith("http://localhost:8000/files/"):
+            filename = url.replace("http://localhost:8000/files/", "")
+            filepath = os.path.join(TEMP_DIR, filename)
+        else:
+            filepath = url
+            
+        if os.path.exists(filepath):
+            filepaths.append(filepath)
+    
+    if not filepaths:
+        print("❌ Stitch error: no clip files found")
+        return None
     
     try:
-        with open(concat_file, "w") as f:
-            for clip in clips:
-                # Extract filename from URL or path
-                url = clip.get("url", "")
-                if url.startswith("http://localhost:8000/files/"):
-                    filename = url.replace("http://localhost:8000/files/", "")
-                    filepath = os.path.join(TEMP_DIR, filename)
-                else:
-                    filepath = url
-                    
-                if os.path.exists(filepath):
-                    f.write(f"file '{filepath}'\n")
-        
-        # Run concat
-        cmd = [
-            "ffmpeg", "-y",
-            "-f", "concat", "-safe", "0",
-            "-i", concat_file,
-            "-c", "copy",
-            output_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Cleanup
-        os.remove(concat_file)
+        # Probes are cached, so clips that were just processed cost nothing here
+        infos = await asyncio.gather(*(asyncio.to_thread(probe, fp) for fp in filepaths))
         
-        if result.returncode != 0:
-            print(f"❌ Stitch error: {result.stderr}")
-            return None
+        # The list file and in-progress output stay out of /files; the directory
+        # is removed on success, failure or timeout alike
+        with tempfile.TemporaryDirectory(dir=WORK_DIR) as work_dir:
+            work_path = os.path.join(work_dir, output_filename)
+            
+            if len({_concat_signature(info) for info in infos}) == 1:
+                # Identical streams: the concat demuxer can stream-copy
+                concat_file = os.path.join(work_dir, "list.txt")
+                with open(concat_file, "w") as f:
+                    for filepath in filepaths:
+                        f.write(f"file '{filepath}'\n")
+            
+                cmd = [
+                    get_ffmpeg_path(), "-hide_banner", "-nostdin", "-y",
+                    "-f", "concat", "-safe", "0",
+                    "-i", concat_file,
+                    "-c", "copy",
+                    "-movflags", "+faststart",
+                    work_path
+                ]
+            else:
+                # Mismatched codecs/geometry would break a stream copy; normalize and encode once
+                print("⚠️ Clips differ in format, re-encoding while stitching")
+                filter_complex, has_audio = _concat_filter(infos)
+            
+                cmd = [get_ffmpeg_path(), "-hide_banner", "-nostdin", "-y"]
+                for filepath in filepaths:
+                    cmd.extend(["-i", filepath])
+                cmd.extend(["-filter_complex", filter_complex, "-map", "[v]"])
+                if has_audio:
+                    cmd.extend(["-map", "[a]", "-c:a", "aac"])
+                cmd.extend([
+                    *await asyncio.to_thread(video_encoder_args, "final"),
+                    "-movflags", "+faststart",
+                    work_path
+                ])
+            
+            await run_ffmpeg(cmd, timeout=RENDER_TIMEOUT, check=True)
+            # Only complete files ever appear under /files
+            os.replace(work_path, output_path)
             
         print(f"✅ Stitched: {output_path}")
         return output_path
@@ -253,7 +400,7 @@ async def stitch_videos(clips: list) -> str | None:
 # LOCAL TEST
 # =========================
 if __name__ == "__main__":
-    import asyncio
+    import time
     
     async def test():
         # Test with a sample video
@@ -263,4 +410,12 @@ if __name__ == "__main__":
         )
         print(f"Result: {result}")
     
-    asyncio.run(test())
+    # RUNS=n repeats the test on the same loop to time it
+    loop = asyncio.new_event_loop()
+    try:
+        for run in range(int(os.getenv("RUNS", "1"))):
+            started = time.perf_counter()
+            loop.run_until_complete(test())
+            print(f"⏱️ Run {run + 1}: {time.perf_counter() - started:.3f}s")
+    finally:
+        loop.close()
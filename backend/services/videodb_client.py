@@ -2,11 +2,40 @@
 VideoDB client wrapper for video editing operations
 """
 import os
-from typing import Optional
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
 from videodb import connect, MediaType
 from videodb.timeline import Timeline
 from videodb.asset import VideoAsset, TextAsset, TextStyle
 
+# Keep-alive connections the SDK's requests session may hold to VideoDB; the
+# requests default of 10 would throttle the worker threads below
+HTTP_POOL_SIZE = 64
+
+# Bounds concurrent VideoDB requests for fan-out operations like upload_videos
+_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("VIDEODB_CONCURRENCY", "8")),
+    thread_name_prefix="videodb"
+)
+
+TEXT_STYLE = TextStyle(
+    fontsize=48,
+    fontcolor="white",
+    bordercolor="black",
+    borderw=2
+)
+
+
+@lru_cache(maxsize=128)
+def _video_asset(asset_id: str, start: float = 0, end: Optional[float] = None) -> VideoAsset:
+    # Assets are only serialized when a timeline compiles, so timelines can share them
+    return VideoAsset(asset_id=asset_id, start=start, end=end)
+
 
 class VideoDBClient:
     """Wrapper around VideoDB SDK for video editing operations"""
@@ -16,19 +45,43 @@ class VideoDBClient:
         if not api_key:
             raise ValueError("VIDEODB_API_KEY environment variable not set")
         self.conn = connect(api_key=api_key)
+        self._tune_session()
         self.collection = self.conn.get_collection()
+        
+        # Video metadata rarely changes; skip repeat lookups across edit calls
+        self._video_cache = TTLCache(maxsize=256, ttl=60)
+        self._list_cache = TTLCache(maxsize=1, ttl=10)
+        # Methods run in worker threads and TTLCache isn't thread-safe
+        self._cache_lock = threading.Lock()
+    
+    def _tune_session(self):
+        """Widen the SDK session's connection pool, keeping its retry policy"""
+        session = getattr(self.conn, "session", None)
+        if session is None:
+            return
+        retries = session.get_adapter("https://").max_retries
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
     
     def upload_video(self, url: str, name: Optional[str] = None) -> dict:
         """Upload a video from URL"""
         video = self.collection.upload(url=url, media_type=MediaType.video, name=name)
+        with self._cache_lock:
+            self._video_cache[video.id] = video
+            self._list_cache.clear()
         return {
             "id": video.id,
             "name": video.name,
             "length": video.length,
             "stream_url": video.stream_url,
-            "thumbnail_url": video.thumbnail_url if hasattr(video, 'thumbnail_url') else None
+            "thumbnail_url": getattr(video, "thumbnail_url", None)
         }
     
+    def upload_videos(self, specs: List[dict]) -> List[dict]:
+        """Upload several videos concurrently; specs are upload_video kwargs, results keep their order"""
+        return list(_POOL.map(lambda spec: self.upload_video(**spec), specs))
+    
     def upload_audio(self, url: str, name: Optional[str] = None) -> dict:
         """Upload audio from URL"""
         audio = self.collection.upload(url=url, media_type=MediaType.audio, name=name)
@@ -39,46 +92,99 @@ class VideoDBClient:
         }
     
     def get_video(self, video_id: str):
-        """Get a video by ID"""
-        return self.collection.get_video(video_id)
+        """Get a video by ID (cached for a minute)"""
+        with self._cache_lock:
+            video = self._video_cache.get(video_id)
+        if video is None:
+            video = self.collection.get_video(video_id)
+            with self._cache_lock:
+                self._video_cache[video_id] = video
+        return video
     
     def list_videos(self) -> list:
-        """List all videos in collection"""
-        videos = self.collection.get_videos()
-        return [
-            {
-                "id": v.id,
-                "name": v.name,
-                "length": v.length,
-                "stream_url": v.stream_url
-            }
-            for v in videos
-        ]
+        """List all videos in collection (cached for a few seconds)"""
+        with self._cache_lock:
+            listed = self._list_cache.get("videos")
+        if listed is None:
+            videos = self.collection.get_videos()
+            listed = [
+                {
+                    "id": v.id,
+                    "name": v.name,
+                    "length": v.length,
+                    "stream_url": v.stream_url
+                }
+                for v in videos
+            ]
+            with self._cache_lock:
+                self._list_cache["videos"] = listed
+                for v in videos:
+                    self._video_cache[v.id] = v
+        # Copies, so callers can't mutate the cached entries
+        return [dict(video) for video in listed]
     
-    def create_timeline(self, video_id: str) -> dict:
-        """Create a timeline from a video for editing"""
+    def build_timeline(self, video_id: str, ops: List[dict]) -> Tuple[Timeline, float]:
+        """
+        Build one timeline from a list of edit operations, so several edits
+        cost a single render instead of one per edit. Returns the timeline and
+        the resulting video duration.
+        
+        ops: [{"op": "trim", "start": .., "end": ..},
+              {"op": "text", "text": .., "start": 0, "duration": 5}, ...]
+        A later trim replaces an earlier one; text overlays are all kept.
+        """
         video = self.get_video(video_id)
         timeline = Timeline(self.conn)
         
-        # Add video as asset
-        video_asset = VideoAsset(asset_id=video.id)
+        trim = next((op for op in reversed(ops) if op["op"] == "trim"), None)
+        if trim is not None:
+            video_asset = _video_asset(video.id, trim["start"], trim["end"])
+            actual_duration = trim["end"] - trim["start"]
+        else:
+            video_asset = _video_asset(video.id)
+            actual_duration = video.length
         timeline.add_inline(video_asset)
         
-        return {
-            "timeline_id": id(timeline),
-            "video_id": video_id,
-            "timeline": timeline
-        }
+        for op in ops:
+            if op["op"] == "text":
+                text_asset = TextAsset(
+                    text=op["text"],
+                    duration=min(op.get("duration", 5), actual_duration),  # Don't exceed video duration
+                    style=TEXT_STYLE
+                )
+                timeline.add_overlay(op.get("start", 0), text_asset)
+            elif op["op"] != "trim":
+                raise ValueError(f"Unknown timeline op: {op['op']}")
+        
+        return timeline, actual_duration
     
-    def trim_video(self, video_id: str, start: float, end: float) -> dict:
-        """Trim a video to specified start and end times"""
-        video = self.get_video(video_id)
-        timeline = Timeline(self.conn)
+    def stream_ops(self, video_id: str, ops: List[dict]) -> Tuple[str, float]:
+        """
+        Get a stream URL for a list of edit operations, taking the cheapest
+        route VideoDB offers. Returns the stream URL and the resulting duration.
         
-        video_asset = VideoAsset(asset_id=video.id, start=start, end=end)
-        timeline.add_inline(video_asset)
+        VideoDB hands back an HLS manifest whose segments are produced as the
+        player requests them; only overlays need a full timeline compile. An
+        untouched video reuses its existing stream, and a plain trim is a
+        segment request on the video itself.
+        """
+        if any(op["op"] != "trim" for op in ops):
+            timeline, actual_duration = self.build_timeline(video_id, ops)
+            return timeline.generate_stream(), actual_duration
         
-        stream_url = timeline.generate_stream()
+        video = self.get_video(video_id)
+        trim = next((op for op in reversed(ops) if op["op"] == "trim"), None)
+        if trim is None:
+            return video.stream_url or video.generate_stream(), video.length
+        
+        # On a copy: generate_stream stores the trimmed URL on the video, and
+        # the cached one must keep its full-length stream_url
+        stream_url = copy.copy(video).generate_stream(timeline=[(trim["start"], trim["end"])])
+        return stream_url, trim["end"] - trim["start"]
+    
+    def trim_video(self, video_id: str, start: float, end: float) -> dict:
+        """Trim a video to specified start and end times"""
+        stream_url, _ = self.stream_ops(video_id, [{"op": "trim", "start": start, "end": end}])
         return {
             "stream_url": stream_url,
             "start": start,
@@ -90,56 +196,50 @@ class VideoDBClient:
                          duration: float = 5, position: str = "center",
                          video_start: float = None, video_end: float = None) -> dict:
         """Add text overlay to video while preserving any trim"""
-        video = self.get_video(video_id)
-        timeline = Timeline(self.conn)
+        result = self.add_text_overlays(
+            video_id,
+            [{"text": text, "start": start, "duration": duration}],
+            video_start=video_start,
+            video_end=video_end
+        )
+        del result["texts"]
+        result["text"] = text
+        return result
+    
+    def add_text_overlays(self, video_id: str, overlays: List[dict],
+                          video_start: float = None, video_end: float = None) -> dict:
+        """
+        Add several text overlays (e.g. subtitles) and render once, instead of
+        one render per caption. Preserves the trim if one is given.
         
-        # Add video track - use trim if specified, otherwise full video
+        overlays: [{"text": .., "start": 0, "duration": 5}, ...]
+        """
+        ops = []
+        # Keep the trim if specified, otherwise the full video
         if video_start is not None and video_end is not None:
-            video_asset = VideoAsset(asset_id=video.id, start=video_start, end=video_end)
-            actual_duration = video_end - video_start
-        else:
-            video_asset = VideoAsset(asset_id=video.id)
-            actual_duration = video.length
-            
-        timeline.add_inline(video_asset)
-        
-        # Add text overlay
-        text_asset = TextAsset(
-            text=text,
-            duration=min(duration, actual_duration),  # Don't exceed video duration
-            style=TextStyle(
-                fontsize=48,
-                fontcolor="white",
-                bordercolor="black",
-                borderw=2
-            )
-        )
-        timeline.add_overlay(start, text_asset)
+            ops.append({"op": "trim", "start": video_start, "end": video_end})
+        ops.extend({"op": "text", **overlay} for overlay in overlays)
         
-        stream_url = timeline.generate_stream()
+        stream_url, actual_duration = self.stream_ops(video_id, ops)
         return {
             "stream_url": stream_url,
-            "text": text,
+            "texts": [overlay["text"] for overlay in overlays],
             "duration": actual_duration,
             "length": actual_duration
         }
-    
-    def render_video(self, timeline) -> dict:
-        """Render the final video"""
-        stream_url = timeline.generate_stream()
-        return {
-            "stream_url": stream_url,
-            "status": "rendered"
-        }
 
 
 # Singleton instance
 _client: Optional[VideoDBClient] = None
+# The startup warm-up and the first request may both get here from worker threads
+_client_lock = threading.Lock()
 
 
 def get_videodb_client() -> VideoDBClient:
     """Get or create VideoDB client instance"""
     global _client
     if _client is None:
-        _client = VideoDBClient()
+        with _client_lock:
+            if _client is None:
+                _client = VideoDBClient()
     return _client
@@ -4,76 +4,223 @@ ElevenLabs Text-to-Speech Integration
 Generates spoken audio responses from AI text using ElevenLabs.
 """
 import os
+import re
 import uuid
-from elevenlabs.client import ElevenLabs
+import asyncio
+import hashlib
+import logging
+import aiofiles
+from typing import AsyncIterator, List, Optional
 from dotenv import load_dotenv
 
+from services.http_client import get_http_client
+
 # Load environment variables
 load_dotenv()
 
-# Initialize ElevenLabs client
-client = None
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+logger = logging.getLogger(__name__)
+
+if not os.getenv("ELEVENLABS_API_KEY"):
+    logger.warning("⚠️ ELEVENLABS_API_KEY not found - voice responses disabled")
+
+# The one voice and model every spoken reply uses, saved or streamed
+TTS_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Rachel voice
+TTS_MODEL_ID = "eleven_monolingual_v1"
+TTS_URL = f"https://api.elevenlabs.io/v1/text-to-speech/{TTS_VOICE_ID}"
+TTS_CHUNK_SIZE = 16384
+
+# Only generated TTS replies are written here; recordings stay in memory.
+# Kept outside the public /files mount: replies are served by GET /api/voice/{key}
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "tts_cache"))
+os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+# Replies are cached by content hash; least recently used are pruned past this size
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 10 * 1024 * 1024))
+
+# Streamed replies are synthesized a sentence group at a time, with at most
+# STREAM_PREFETCH ElevenLabs requests in flight; pieces that finish early are
+# buffered in memory until playback reaches them
+STREAM_CHUNK_CHARS = 200
+STREAM_PREFETCH = 2
+
+
+async def synthesize_speech(text: str) -> AsyncIterator[bytes]:
+    """Synthesize text, yielding MP3 bytes as ElevenLabs sends them"""
+    async with get_http_client().stream(
+        "POST",
+        TTS_URL,
+        headers={"xi-api-key": os.getenv("ELEVENLABS_API_KEY"), "Accept": "audio/mpeg"},
+        json={"text": text, "model_id": TTS_MODEL_ID}
+    ) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(TTS_CHUNK_SIZE):
+            yield chunk
+
+
+async def warm_up_tts() -> bool:
+    """Open the pooled connection to ElevenLabs ahead of the first reply; False when not configured"""
+    api_key = os.getenv("ELEVENLABS_API_KEY")
+    if not api_key:
+        return False
+    response = await get_http_client().get(
+        "https://api.elevenlabs.io/v1/models",
+        headers={"xi-api-key": api_key}
+    )
+    response.raise_for_status()
+    return True
 
-if ELEVENLABS_API_KEY:
-    client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-else:
-    print("⚠️ ELEVENLABS_API_KEY not found - voice responses disabled")
 
-# Temp storage for audio files
-TEMP_DIR = os.path.join(os.path.dirname(__file__), "..", "temp_storage")
-os.makedirs(TEMP_DIR, exist_ok=True)
+def tts_cache_key(text: str) -> str:
+    """Content address for a TTS reply: same voice, model and text → same audio"""
+    return hashlib.sha256(f"{TTS_VOICE_ID}|{TTS_MODEL_ID}|{text}".encode()).hexdigest()[:16]
 
 
-def generate_voice_reply(text: str) -> str | None:
+def tts_cache_path(key: str) -> str:
+    return os.path.join(TTS_CACHE_DIR, f"tts_{key}.mp3")
+
+
+def prune_tts_cache(max_bytes: int = TTS_CACHE_MAX_BYTES):
+    """Delete least recently used TTS replies until the cache fits in max_bytes"""
+    entries = [
+        entry for entry in os.scandir(TTS_CACHE_DIR)
+        if entry.name.startswith("tts_") and entry.name.endswith(".mp3")
+    ]
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    
+    total = 0
+    for entry in entries:
+        total += entry.stat().st_size
+        if total > max_bytes:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _chunk_text(text: str, max_chars: int = STREAM_CHUNK_CHARS) -> List[str]:
+    """Split text at sentence boundaries into pieces of at most max_chars (a longer sentence stays whole)"""
+    sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def generate_voice_reply(text: str) -> Optional[str]:
     """
-    Generates a spoken audio response from text using ElevenLabs.
-    Uses 'eleven_turbo_v2' model for low latency.
+    Generates a spoken audio response and saves it as an MP3 in the TTS cache.
+    Replies already in the cache are returned without calling ElevenLabs.
     
     Args:
         text: The text to convert to speech
         
     Returns:
-        Path to the generated MP3 file, or None if failed
+        Path to the MP3 file, or None if failed
     """
-    if not text or not client:
-        return None
-
+    tmp_path = None
     try:
-        print(f"🎙️ Generating Voice Reply: '{text[:50]}...'")
-
-        # Use text_to_speech.convert() which returns a generator
-        audio_stream = client.text_to_speech.convert(
-            text=text,
-            voice_id="JBFqnCBsd6RMkjVDRZzb",  # 'George' voice - friendly male
-            model_id="eleven_turbo_v2",        # Optimized for low latency
-            output_format="mp3_44100_128"      # Standard MP3 format
-        )
-
-        # Save to file
-        filename = f"reply_{uuid.uuid4()}.mp3"
-        filepath = os.path.join(TEMP_DIR, filename)
+        output_path = tts_cache_path(tts_cache_key(text))
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            os.utime(output_path)  # Mark as recently used for pruning
+            logger.debug("✅ Voice reply cache hit: %s", os.path.basename(output_path))
+            return output_path
         
-        with open(filepath, "wb") as f:
-            for chunk in audio_stream:
-                if chunk:
-                    f.write(chunk)
+        if not text or not os.getenv("ELEVENLABS_API_KEY"):
+            return None
+        
+        # Stream the mp3 straight to disk; write then rename so a concurrent
+        # hit never sees a partial file
+        tmp_path = f"{output_path}.{uuid.uuid4().hex[:8]}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in synthesize_speech(text):
+                await f.write(chunk)
+        os.replace(tmp_path, output_path)
+        
+        await asyncio.to_thread(prune_tts_cache)
+        
+        logger.debug("✅ Voice reply saved: %s", os.path.basename(output_path))
+        return output_path
         
-        print(f"✅ Voice generated: {filepath}")
-        return filepath
-
     except Exception as e:
-        print(f"❌ ElevenLabs Error: {e}")
+        logger.error("❌ ElevenLabs error: %s", e)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
         return None
 
 
+async def generate_voice_reply_stream(text: str) -> AsyncIterator[bytes]:
+    """
+    Stream a spoken reply as MP3 bytes, sentence group by sentence group, so
+    playback can start after the first piece is synthesized. The next pieces
+    are requested while earlier ones are still streaming, STREAM_PREFETCH at
+    a time. Served by POST /api/voice/stream.
+    
+    If any piece fails, the error is raised when playback reaches it, so the
+    stream ends there instead of skipping that sentence.
+    """
+    if not text or not os.getenv("ELEVENLABS_API_KEY"):
+        return
+
+    pieces = _chunk_text(text)
+    queues = [asyncio.Queue() for _ in pieces]
+    slots = asyncio.Semaphore(STREAM_PREFETCH)
+
+    async def synthesize(piece: str, queue: asyncio.Queue):
+        async with slots:
+            try:
+                async for chunk in synthesize_speech(piece):
+                    if chunk:
+                        queue.put_nowait(chunk)
+            except Exception as e:
+                logger.error("❌ ElevenLabs Error: %s", e)
+                queue.put_nowait(e)  # Re-raised to the consumer in order
+            else:
+                queue.put_nowait(None)  # End of this piece
+
+    # Semaphore waiters are served in order, so pieces start in reading order
+    tasks = [asyncio.create_task(synthesize(piece, queue)) for piece, queue in zip(pieces, queues)]
+    try:
+        for queue in queues:
+            while (chunk := await queue.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
 # =========================
 # LOCAL TEST
 # =========================
 if __name__ == "__main__":
+    import time
+    from services.http_client import close_http_client
+    
+    async def test(run: int):
+        # Distinct text per run (and per invocation), otherwise runs time cache hits, not TTS
+        text = f"Hello! I am Frame, your AI video editor. Take {run + 1} at {time.strftime('%H:%M:%S')}."
+        path = await generate_voice_reply(text)
+        if path:
+            print(f"Success! File saved at: {path}")
+        else:
+            print("Failed to generate voice.")
+    
+    logging.basicConfig(level=logging.DEBUG)
     print("Testing ElevenLabs generation...")
-    path = generate_voice_reply("Hello! I am Frame, your AI video editor.")
-    if path:
-        print(f"Success! File saved at: {path}")
-    else:
-        print("Failed to generate voice.")
+    # Reuse one loop so the shared HTTP client keeps its ElevenLabs connection between runs
+    loop = asyncio.new_event_loop()
+    try:
+        for run in range(int(os.getenv("RUNS", "1"))):
+            started = time.perf_counter()
+            loop.run_until_complete(test(run))
+            print(f"⏱️ Run {run + 1}: {time.perf_counter() - started:.3f}s")
+    finally:
+        loop.run_until_complete(close_http_client())
+        loop.close()
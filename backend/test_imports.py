@@ -1,8 +1,21 @@
+import ast
+import importlib.util
+import os
+
+# Check the SDK without importing it: find_spec on the top-level package
+# doesn't execute videodb/__init__.py, and the module source is only parsed
 try:
-    import videodb.timeline
-    print(f"Module content: {dir(videodb.timeline)}")
-    
-    from videodb.timeline import Timeline
+    spec = importlib.util.find_spec("videodb")
+    assert spec and spec.submodule_search_locations, "videodb is not installed"
+
+    timeline_path = os.path.join(spec.submodule_search_locations[0], "timeline.py")
+    assert os.path.exists(timeline_path), "videodb.timeline is missing"
+
+    with open(timeline_path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=timeline_path)
+    assert any(
+        isinstance(node, ast.ClassDef) and node.name == "Timeline" for node in tree.body
+    ), "videodb.timeline does not define Timeline"
     print("Timeline import OK")
 
 except Exception as e: